@@ -0,0 +1,60 @@
+"""
+Admission control: per-user token buckets and queue-depth caps, answered with 429s
+"""
+import math
+import time
+from typing import Dict, Optional, Tuple
+from fastapi.responses import JSONResponse
+from config import (
+    RATE_LIMITS, MAX_QUEUED_LISTINGS, MAX_QUEUED_PER_USER, USER_CACHE_MAX
+)
+from throughput import estimate_wait
+
+# Token buckets: {(user_id, bucket): (tokens, updated_at)}
+_buckets: Dict[Tuple[int, str], Tuple[float, float]] = {}
+
+
+def take_token(user_id: int, bucket: str) -> Optional[float]:
+    """Spend one token from the user's bucket; returns seconds to wait if it is empty"""
+    per_minute, burst = RATE_LIMITS[bucket]
+    rate = per_minute / 60.0
+    now = time.monotonic()
+    
+    key = (user_id, bucket)
+    tokens, updated_at = _buckets.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    
+    if tokens < 1:
+        _buckets[key] = (tokens, now)
+        return (1 - tokens) / rate
+    
+    if len(_buckets) >= USER_CACHE_MAX and key not in _buckets:
+        # Idle for 10 minutes means refilled: nothing worth keeping
+        for stale in [k for k, (_, u) in _buckets.items() if now - u > 600]:
+            del _buckets[stale]
+    _buckets[key] = (tokens - 1, now)
+    return None
+
+
+def queue_room(cursor, user_id: int) -> int:
+    """How many more listings may be queued now, under both the global and the user's cap"""
+    cursor.execute("SELECT COUNT(*) FROM listings WHERE status = 'pending'")
+    queued = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM listings WHERE user_id = ? AND status = 'pending'", (user_id,))
+    user_queued = cursor.fetchone()[0]
+    return min(MAX_QUEUED_LISTINGS - queued, MAX_QUEUED_PER_USER - user_queued)
+
+
+def queue_retry_after(room: int) -> float:
+    """Seconds until the checkers have drained enough of the queue to admit one more"""
+    return estimate_wait(1 - room)
+
+
+def too_many_requests(message: str, retry_after: float) -> JSONResponse:
+    """429 with a Retry-After header (whole seconds, at least 1)"""
+    seconds = max(1, math.ceil(retry_after))
+    return JSONResponse(
+        {'status': 'error', 'message': message, 'retry_after': seconds},
+        status_code=429,
+        headers={'Retry-After': str(seconds)}
+    )
@@ -1,92 +1,231 @@
-"""
-Authentication and authorization decorators
-"""
-from functools import wraps
-import inspect
-from typing import Optional
-from fastapi import Request, HTTPException
-from database import get_user_by_id
-from config import ADMIN_TOKENS
-
-
-def get_current_user(request: Request) -> Optional[dict]:
-    """Get current logged-in user from cookies"""
-    if not request:
-        return None
-    
-    cookies = getattr(request, 'cookies', None)
-    if not cookies:
-        return None
-    
-    uid = cookies.get('uid')
-    if not uid:
-        return None
-    
-    try:
-        user = get_user_by_id(int(uid))
-        return user
-    except (ValueError, TypeError):
-        return None
-
-
-def login_required(f):
-    """Decorator to require user login"""
-    @wraps(f)
-    async def wrapper(*args, **kwargs):
-        # Find the Request object in args or kwargs
-        request = kwargs.get('request') or kwargs.get('req') or next(
-            (v for v in args if isinstance(v, Request)), None
-        )
-        
-        user = get_current_user(request)
-        if not user:
-            raise HTTPException(status_code=401, detail="Authentication required")
-        
-        return await f(*args, **kwargs)
-    
-    # Preserve function signature for FastAPI
-    try:
-        wrapper.__signature__ = inspect.signature(f)
-    except:
-        pass
-    
-    return wrapper
-
-
-def admin_required(f):
-    """Decorator to require admin privileges"""
-    @wraps(f)
-    async def wrapper(*args, **kwargs):
-        # Find the Request object
-        request = kwargs.get('request') or kwargs.get('req') or next(
-            (v for v in args if isinstance(v, Request)), None
-        )
-        
-        # Check if user is logged in as admin
-        user = get_current_user(request)
-        if user and user.get('is_admin'):
-            return await f(*args, **kwargs)
-        
-        # Check for admin token in query params
-        token = request.query_params.get('token') if request else None
-        
-        # Check for token in form data (POST requests)
-        if not token and request and getattr(request, 'method', '').upper() in ('POST', 'PUT', 'DELETE'):
-            try:
-                form = await request.form()
-                token = form.get('token')
-            except:
-                pass
-        
-        if token and token in ADMIN_TOKENS:
-            return await f(*args, **kwargs)
-        
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    # Preserve function signature for FastAPI
-    try:
-        wrapper.__signature__ = inspect.signature(f)
-    except:
-        pass
-    
+"""
+Authentication and authorization decorators
+"""
+from functools import wraps
+import inspect
+import time
+import hmac
+import json
+import base64
+import hashlib
+import secrets
+from typing import Optional, Dict, Tuple
+from fastapi import Request, HTTPException, Response
+from database import get_user_by_id, get_or_create_setting, run_db, fetch_all, execute
+from config import (
+    ADMIN_TOKENS, USER_CACHE_TTL, USER_CACHE_MAX,
+    SESSION_SECRET, SESSION_TTL, SESSION_TOKEN_VERSION, REVOCATION_REFRESH_SECONDS
+)
+
+SESSION_COOKIE = 'session'
+
+_session_secret: Optional[bytes] = None
+
+# Revoked token IDs: {jti: expires_ts}, reloaded from the database periodically
+_revoked: Dict[str, int] = {}
+_revoked_loaded_at = 0.0
+
+# Resolved users by ID: {user_id: (expires_at, user)}
+_user_cache: Dict[int, Tuple[float, dict]] = {}
+
+
+def invalidate_user(user_id: int):
+    """Forget a cached user (call after balance or profile changes)"""
+    _user_cache.pop(user_id, None)
+
+
+async def get_user_cached(user_id: int) -> Optional[dict]:
+    """Get user by ID, reusing a recent lookup when possible"""
+    now = time.time()
+    cached = _user_cache.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    user = await run_db(get_user_by_id, user_id)
+    if user:
+        if len(_user_cache) >= USER_CACHE_MAX:
+            for uid in [uid for uid, (expires, _) in _user_cache.items() if expires <= now]:
+                del _user_cache[uid]
+            if len(_user_cache) >= USER_CACHE_MAX:
+                _user_cache.clear()
+        _user_cache[user_id] = (now + USER_CACHE_TTL, user)
+    return user
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+async def _get_secret() -> bytes:
+    """Signing key: SESSION_SECRET, or one generated once and shared by all workers via the DB"""
+    global _session_secret
+    if _session_secret is None:
+        secret = SESSION_SECRET or await run_db(get_or_create_setting, 'session_secret', secrets.token_hex(32))
+        _session_secret = secret.encode()
+    return _session_secret
+
+
+async def create_session_token(user: dict) -> str:
+    """Sign an expiring token carrying the user id (the admin flag is read from the user row)"""
+    claims = {
+        'uid': user['id'],
+        'ver': SESSION_TOKEN_VERSION,
+        'exp': int(time.time()) + SESSION_TTL,
+        'jti': secrets.token_urlsafe(12)
+    }
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    signature = hmac.new(await _get_secret(), payload.encode(), hashlib.sha256).digest()
+    return f"{payload}.{_b64encode(signature)}"
+
+
+async def _refresh_revocations():
+    """Reload the revocation list if this worker's copy is stale"""
+    global _revoked, _revoked_loaded_at
+    now = time.time()
+    if now - _revoked_loaded_at < REVOCATION_REFRESH_SECONDS:
+        return
+    _revoked_loaded_at = now
+    rows = await fetch_all('SELECT jti, expires_ts FROM revoked_sessions WHERE expires_ts > ?', (int(now),))
+    _revoked = {jti: expires_ts for jti, expires_ts in rows}
+
+
+async def decode_session_token(token: str) -> Optional[dict]:
+    """Verify signature, version, expiry and revocation; returns the claims or None"""
+    try:
+        payload, signature = token.split('.')
+        expected = hmac.new(await _get_secret(), payload.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (AttributeError, ValueError, TypeError):
+        return None
+    
+    if claims.get('ver') != SESSION_TOKEN_VERSION or claims.get('exp', 0) <= time.time():
+        return None
+    
+    await _refresh_revocations()
+    if claims.get('jti') in _revoked:
+        return None
+    return claims
+
+
+async def revoke_session(claims: dict):
+    """Put a token on the revocation list until it would have expired anyway"""
+    _revoked[claims['jti']] = claims['exp']
+    await execute('DELETE FROM revoked_sessions WHERE expires_ts <= ?', (int(time.time()),))
+    await execute(
+        'INSERT OR IGNORE INTO revoked_sessions (jti, expires_ts) VALUES (?, ?)',
+        (claims['jti'], claims['exp'])
+    )
+
+
+async def get_session(request: Request) -> Optional[dict]:
+    """Claims of the request's session token (verified once per request)"""
+    if not request:
+        return None
+    
+    state = getattr(request, 'state', None)
+    if state is not None and hasattr(state, 'session'):
+        return state.session
+    
+    cookies = getattr(request, 'cookies', None)
+    token = cookies.get(SESSION_COOKIE) if cookies else None
+    claims = await decode_session_token(token) if token else None
+    if state is not None:
+        state.session = claims
+    return claims
+
+
+async def get_current_user(request: Request) -> Optional[dict]:
+    """Get current logged-in user from the session token (resolved once per request)"""
+    if not request:
+        return None
+    
+    # Already resolved earlier in this request
+    state = getattr(request, 'state', None)
+    if state is not None and hasattr(state, 'user'):
+        return state.user
+    
+    claims = await get_session(request)
+    user = await get_user_cached(claims['uid']) if claims else None
+    if state is not None:
+        state.user = user
+    return user
+
+
+def _clear_session_headers() -> dict:
+    """Set-Cookie header deleting the session cookie (sent with a 401 for a stale token)"""
+    response = Response()
+    response.delete_cookie(SESSION_COOKIE)
+    return {'set-cookie': response.headers['set-cookie']}
+
+
+def login_required(f):
+    """Decorator to require user login"""
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        # Find the Request object in args or kwargs
+        request = kwargs.get('request') or kwargs.get('req') or next(
+            (v for v in args if isinstance(v, Request)), None
+        )
+        
+        if not await get_session(request):
+            raise HTTPException(status_code=401, detail="Authentication required")
+        
+        # A valid token for a deleted account: 401 (and drop the cookie) rather than a None user in the handler
+        if not await get_current_user(request):
+            raise HTTPException(status_code=401, detail="Authentication required", headers=_clear_session_headers())
+        
+        return await f(*args, **kwargs)
+    
+    # Preserve function signature for FastAPI
+    try:
+        wrapper.__signature__ = inspect.signature(f)
+    except:
+        pass
+    
+    return wrapper
+
+
+def admin_required(f):
+    """Decorator to require admin privileges"""
+    @wraps(f)
+    async def wrapper(*args, **kwargs):
+        # Find the Request object
+        request = kwargs.get('request') or kwargs.get('req') or next(
+            (v for v in args if isinstance(v, Request)), None
+        )
+        
+        # Check if user is logged in as admin: the flag is read from the (cached) user row,
+        # not the token, so removing it takes effect within USER_CACHE_TTL
+        user = await get_current_user(request)
+        if user and user.get('is_admin'):
+            return await f(*args, **kwargs)
+        
+        # Check for admin token in query params
+        token = request.query_params.get('token') if request else None
+        
+        # Check for token in form data (POST requests)
+        if not token and request and getattr(request, 'method', '').upper() in ('POST', 'PUT', 'DELETE'):
+            try:
+                form = await request.form()
+                token = form.get('token')
+            except:
+                pass
+        
+        if token and token in ADMIN_TOKENS:
+            return await f(*args, **kwargs)
+        
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # Preserve function signature for FastAPI
+    try:
+        wrapper.__signature__ = inspect.signature(f)
+    except:
+        pass
+    
     return wrapper
\ No newline at end of file
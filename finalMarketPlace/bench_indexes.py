@@ -0,0 +1,162 @@
+"""
+Benchmark the hot-path queries before and after the index migration
+Builds a synthetic database (1M listings by default) in a temp directory:
+
+    python bench_indexes.py [--listings 1000000] [--repeat 20]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+INDEX_MIGRATION = 2  # the migration whose indexes these queries were written for
+
+
+def build_database(conn, listings: int, users: int, campaigns: int, withdrawals: int):
+    """Fill the base schema with synthetic, roughly realistic data"""
+    rng = random.Random(42)
+    now = int(time.time())
+    cursor = conn.cursor()
+
+    cursor.executemany(
+        'INSERT INTO users (username, password_hash, telegram_username, usdt_wallet, balance, created_ts) VALUES (?, ?, ?, ?, ?, ?)',
+        ((f'user{i}', 'x' * 64, f'@user{i}', f'0x{i:040x}', 0, now) for i in range(users))
+    )
+    cursor.executemany(
+        'INSERT INTO campaigns (title, year, month, price_usd, target_count, sold_count, created_ts) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((f'Campaign {i}', 2016 + i % 8, None, 5 + i % 20, 1000, 0, now) for i in range(campaigns))
+    )
+    cursor.executemany(
+        'INSERT INTO admin_sessions (session_text, username, session_type, status, groups_received, last_used_ts) VALUES (?, ?, ?, ?, ?, ?)',
+        (('s', f'acc{i}', ('checker', 'receiver')[i % 2], 'ready', 0, now - i) for i in range(40))
+    )
+
+    statuses = ['sold'] * 50 + ['failed'] * 40 + ['ready_for_transfer'] * 5 + ['pending'] * 5
+
+    def listing_rows():
+        for i in range(listings):
+            status = rng.choice(statuses)
+            yield (
+                rng.randint(1, users), rng.randint(1, campaigns), f't.me/group{i}', '@seller', '0xabc',
+                10.0, status, None, 'log line\n' * 5, None, rng.randint(1, 40),
+                now - listings + i, now - listings + i + 60 if status == 'sold' else None,
+                rng.random() < 0.8 if status == 'sold' else 0
+            )
+
+    cursor.executemany(
+        '''INSERT INTO listings (user_id, campaign_id, group_link, seller_tg, seller_usdt, price_usd, status,
+           check_reason, check_log, checked_by_session, receiver_session, created_ts, transferred_ts,
+           included_in_withdrawal) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        listing_rows()
+    )
+    cursor.executemany(
+        'INSERT INTO withdrawals (user_id, seller_usdt, amount_usdt, status, created_ts) VALUES (?, ?, ?, ?, ?)',
+        ((rng.randint(1, users), '0xabc', 10.0, 'pending' if rng.random() < 0.05 else 'paid', now - i)
+         for i in range(withdrawals))
+    )
+    conn.commit()
+
+
+def hot_queries(user_id: int):
+    """(name, sql, params) for every query the indexes were designed for"""
+    return [
+        ('worker: next pending',
+         "SELECT id, campaign_id, group_link FROM listings WHERE status='pending' ORDER BY created_ts ASC LIMIT 1", ()),
+        ('/: recent listings',
+         '''SELECT l.id, l.group_link, l.status, c.title, l.price_usd, l.created_ts FROM listings l
+            LEFT JOIN campaigns c ON l.campaign_id = c.id WHERE l.user_id = ? ORDER BY l.created_ts DESC LIMIT 5''',
+         (user_id,)),
+        ('/profile: total count', 'SELECT COUNT(*) FROM listings WHERE user_id=?', (user_id,)),
+        ('/profile: sold count', "SELECT COUNT(*) FROM listings WHERE user_id=? AND status='sold'", (user_id,)),
+        ('/profile: listings',
+         '''SELECT l.id, l.group_link, l.status, l.price_usd, l.check_log, c.title, l.created_ts, l.receiver_session
+            FROM listings l LEFT JOIN campaigns c ON l.campaign_id = c.id WHERE l.user_id = ? ORDER BY l.created_ts DESC''',
+         (user_id,)),
+        ('/profile: withdrawals',
+         'SELECT amount_usdt, seller_usdt, status, created_ts FROM withdrawals WHERE user_id=? ORDER BY created_ts DESC',
+         (user_id,)),
+        ('/withdraw: unpaid sold groups',
+         '''SELECT l.id, l.group_link, l.price_usd, l.receiver_session, a.username FROM listings l
+            LEFT JOIN admin_sessions a ON l.receiver_session = a.id
+            WHERE l.user_id = ? AND l.status = 'sold' AND l.included_in_withdrawal = 0 ORDER BY l.transferred_ts ASC''',
+         (user_id,)),
+        ('/admin: pending withdrawals', "SELECT id, seller_usdt, amount_usdt FROM withdrawals WHERE status='pending'", ()),
+        ('sessions: free checker',
+         "SELECT id FROM admin_sessions WHERE session_type='checker' AND status='ready' ORDER BY last_used_ts ASC LIMIT 1", ()),
+    ]
+
+
+def measure(conn, queries, repeat: int) -> dict:
+    """Median latency (ms) and query plan for every query"""
+    results = {}
+    for name, sql, params in queries:
+        plan = '; '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = (statistics.median(timings), plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--listings', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_indexes_')
+    os.environ['DB_PATH'] = os.path.join(workdir, 'bench.db')
+
+    from database import get_connection, close_all_connections
+    from migrations import migrate
+
+    conn = get_connection()
+    migrate(conn, target_version=1)
+
+    print(f"Building synthetic database with {args.listings:,} listings in {workdir} ...")
+    start = time.perf_counter()
+    build_database(conn, args.listings, args.users, campaigns=50, withdrawals=args.listings // 10)
+    conn.execute('ANALYZE')
+    print(f"✓ Built in {time.perf_counter() - start:.1f}s")
+
+    # Heaviest seller is the interesting case for per-user queries
+    user_id = conn.execute(
+        'SELECT user_id FROM listings GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1'
+    ).fetchone()[0]
+    queries = hot_queries(user_id)
+
+    before = measure(conn, queries, args.repeat)
+
+    # Only the index migration: later versions change these queries (v6 replaces the FIFO
+    # worker query with the fair-queue claim), so timing them against v1 would mislead
+    start = time.perf_counter()
+    version = migrate(conn, target_version=INDEX_MIGRATION)
+    conn.execute('ANALYZE')
+    print(f"✓ Migrated to schema v{version} in {time.perf_counter() - start:.1f}s")
+
+    after = measure(conn, queries, args.repeat)
+    conn.close()
+    close_all_connections()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print('=' * 100)
+    print(f"{'QUERY':<32}{'BEFORE ms':>12}{'AFTER ms':>12}{'SPEEDUP':>10}")
+    print('=' * 100)
+    for name, _, _ in queries:
+        b_ms, b_plan = before[name]
+        a_ms, a_plan = after[name]
+        print(f"{name:<32}{b_ms:>12.2f}{a_ms:>12.3f}{b_ms / max(a_ms, 1e-6):>9.0f}x")
+        print(f"    before: {b_plan}")
+        print(f"    after:  {a_plan}")
+    print('=' * 100)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
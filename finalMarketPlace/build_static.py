@@ -0,0 +1,77 @@
+"""
+Build fingerprinted, precompressed copies of the static assets
+
+Usage: python build_static.py (run from the project directory, after changing anything in static/)
+
+Writes static/build/<name>.<hash><ext> plus .gz and .br (brotli, from
+requirements.txt; skipped if it is missing) next to it, and static/build/manifest.json,
+which the templates' static_url() reads at startup.
+"""
+import os
+import gzip
+import json
+import shutil
+import hashlib
+
+from config import STATIC_DIR, STATIC_BUILD_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+
+
+def _sources():
+    """Relative paths of every asset under static/, except earlier build output"""
+    for root, dirs, files in os.walk(STATIC_DIR):
+        if os.path.abspath(root) == os.path.abspath(STATIC_DIR):
+            dirs[:] = [d for d in dirs if d != STATIC_BUILD_DIR]
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, '/')
+
+
+def _write_compressed(path: str, data: bytes):
+    """Keep only variants that are actually smaller"""
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def build() -> dict:
+    """Rebuild STATIC_DIR/STATIC_BUILD_DIR from scratch; returns the manifest"""
+    build_dir = os.path.join(STATIC_DIR, STATIC_BUILD_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    manifest = {}
+    for name in list(_sources()):
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        fingerprinted = f"{STATIC_BUILD_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+        out_path = os.path.join(STATIC_DIR, fingerprinted)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)  # assets in subdirectories
+        with open(out_path, 'wb') as f:
+            f.write(data)
+        if ext in COMPRESSED_EXTENSIONS:
+            _write_compressed(out_path, data)
+
+        manifest[name] = fingerprinted
+        print(f"{name} -> {fingerprinted}")
+
+    with open(os.path.join(build_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+    if not brotli:
+        print("brotli not installed: writing gzip variants only (pip install brotli)")
+    print(f"Built {len(build())} asset(s) into {os.path.join(STATIC_DIR, STATIC_BUILD_DIR)}")
@@ -0,0 +1,64 @@
+"""
+In-process campaign read model shared by the pages, admin and the checker
+"""
+import time
+import asyncio
+from typing import Optional, List, Dict
+
+from config import CAMPAIGN_CACHE_TTL
+from database import run_db, get_all_campaigns
+
+_campaigns: Optional[List[dict]] = None  # newest first, progress precomputed
+_campaigns_by_id: Dict[int, dict] = {}
+_loaded_at = 0.0
+_load_lock = asyncio.Lock()
+
+# Bumped on every change; page fragments rendered from campaigns key on it
+version = 0
+
+
+def invalidate_campaigns():
+    """Drop the cached campaigns, the next read reloads them"""
+    global _campaigns, version
+    _campaigns = None
+    version += 1
+
+
+async def get_campaigns() -> List[dict]:
+    """All campaigns, newest first (served from memory when fresh)"""
+    global _campaigns, _campaigns_by_id, _loaded_at, version
+
+    if _campaigns is not None and time.time() - _loaded_at < CAMPAIGN_CACHE_TTL:
+        return _campaigns
+
+    async with _load_lock:
+        # Another coroutine may have reloaded while we waited
+        if _campaigns is not None and time.time() - _loaded_at < CAMPAIGN_CACHE_TTL:
+            return _campaigns
+
+        loading_version = version
+        campaigns = await run_db(get_all_campaigns)
+
+        # An invalidation during the load means these rows may be stale
+        if loading_version != version:
+            return campaigns
+
+        if campaigns != _campaigns:
+            version += 1
+        _campaigns = campaigns
+        _campaigns_by_id = {c['id']: c for c in campaigns}
+        _loaded_at = time.time()
+        return campaigns
+
+
+def cached_version(campaigns: List[dict]) -> Optional[int]:
+    """Version of a list returned by get_campaigns, None if it is already stale"""
+    return version if campaigns is not None and campaigns is _campaigns else None
+
+
+async def get_campaign(campaign_id: int) -> Optional[dict]:
+    """Single campaign by ID, None if it does not exist"""
+    campaigns = await get_campaigns()
+    if campaigns is _campaigns:
+        return _campaigns_by_id.get(campaign_id)
+    return next((c for c in campaigns if c['id'] == campaign_id), None)
@@ -0,0 +1,70 @@
+"""
+Per-campaign slot accounting: how many more groups a campaign can still buy
+"""
+
+# Listings that hold one of the campaign's target_count slots. Pending and
+# checking listings (queued or being checked) hold a slot so sellers cannot over-submit; they give
+# it back when they fail.
+RESERVED_STATUSES = ('pending', 'checking', 'ready_for_transfer', 'sold')
+
+# Listings that passed the checks; once these fill the target the campaign is closed
+COMMITTED_STATUSES = ('ready_for_transfer', 'sold')
+
+
+def _count(cursor, campaign_id: int, statuses: tuple) -> int:
+    placeholders = ', '.join('?' * len(statuses))
+    cursor.execute(
+        f'SELECT COUNT(*) FROM listings WHERE campaign_id=? AND status IN ({placeholders})',
+        (campaign_id, *statuses)
+    )
+    return cursor.fetchone()[0]
+
+
+def _target(cursor, campaign_id: int) -> int:
+    cursor.execute('SELECT target_count FROM campaigns WHERE id=?', (campaign_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def open_slots(cursor, campaign_id: int) -> int:
+    """Slots not yet reserved by a pending, ready or sold listing"""
+    return max(0, _target(cursor, campaign_id) - _count(cursor, campaign_id, RESERVED_STATUSES))
+
+
+def campaign_closed(cursor, campaign_id: int) -> bool:
+    """True once checked (ready or sold) listings fill the target"""
+    return _count(cursor, campaign_id, COMMITTED_STATUSES) >= _target(cursor, campaign_id)
+
+
+def promote_if_open(cursor, listing_id: int, campaign_id: int, check_log: str,
+                    checked_by_session: int, receiver_session: int) -> bool:
+    """
+    Move a checked listing to ready_for_transfer in one statement, only while
+    the campaign still has room; False means it closed during the check
+    """
+    cursor.execute(
+        '''UPDATE listings SET status="ready_for_transfer", check_log=?, checked_by_session=?, receiver_session=?
+           WHERE id=? AND status="checking"
+             AND (SELECT COUNT(*) FROM listings WHERE campaign_id=? AND status IN ("ready_for_transfer", "sold"))
+                 < (SELECT target_count FROM campaigns WHERE id=?)''',
+        (check_log, checked_by_session, receiver_session, listing_id, campaign_id, campaign_id)
+    )
+    return cursor.rowcount == 1
+
+
+def fail_queued(cursor, campaign_id: int, claimed_id: int, check_log: str) -> list:
+    """
+    Fail a closed campaign's queued listings plus the one just claimed
+    Returns: [(listing_id, user_id)] of the listings failed
+    """
+    cursor.execute(
+        "SELECT id, user_id FROM listings WHERE campaign_id=? AND (status='pending' OR id=?)",
+        (campaign_id, claimed_id)
+    )
+    failed = cursor.fetchall()
+    cursor.execute(
+        '''UPDATE listings SET status='failed', check_reason='campaign_full', check_log=?
+           WHERE campaign_id=? AND (status='pending' OR id=?)''',
+        (check_log, campaign_id, claimed_id)
+    )
+    return failed
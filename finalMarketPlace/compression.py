@@ -0,0 +1,81 @@
+"""
+Gzip middleware for dynamic responses, flushing per chunk so streamed pages stay streamed
+"""
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript', 'image/svg+xml')
+
+# Event streams must reach the browser event by event, static files come precompressed
+SKIPPED_PATHS = ('/events', '/sell/import', '/static/')
+
+
+class CompressionMiddleware:
+    """Compress responses of at least COMPRESSION_MIN_SIZE bytes when the client accepts gzip"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (scope['type'] != 'http' or scope['path'].startswith(SKIPPED_PATHS)
+                or 'gzip' not in Headers(scope=scope).get('accept-encoding', '')):
+            await self.app(scope, receive, send)
+            return
+        await _GzipResponder(send).run(self.app, scope, receive)
+
+
+class _GzipResponder:
+    def __init__(self, send: Send):
+        self.send = send
+        self.start = None  # held back until the first body shows whether to compress
+        self.compressor = None
+        self.passthrough = False
+
+    async def run(self, app: ASGIApp, scope: Scope, receive: Receive):
+        await app(scope, receive, self.on_message)
+
+    async def on_message(self, message: Message):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            return
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.compressor is None:
+            headers = Headers(raw=self.start['headers'])
+            content_type = headers.get('content-type', '')
+            small = not more_body and len(body) < COMPRESSION_MIN_SIZE
+            if (small or 'content-encoding' in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            self.compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+            headers = MutableHeaders(raw=self.start['headers'])
+            headers['Content-Encoding'] = 'gzip'
+            headers.add_vary_header('Accept-Encoding')
+            if 'content-length' in headers:
+                del headers['content-length']
+            if not more_body:
+                data = self.compressor.compress(body) + self.compressor.flush()
+                headers['Content-Length'] = str(len(data))
+                await self.send(self.start)
+                await self.send({'type': 'http.response.body', 'body': data})
+                return
+            await self.send(self.start)
+
+        # Sync flush: every chunk the app sends goes out now rather than when zlib's buffer fills
+        if more_body:
+            data = self.compressor.compress(body) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            data = self.compressor.compress(body) + self.compressor.flush()
+        await self.send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
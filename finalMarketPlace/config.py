@@ -1,68 +1,158 @@
-"""
-Configuration settings for Telegram Group Seller Platform
-"""
-import os
-from dotenv import load_dotenv
-load_dotenv()
-# Database
-DB_PATH = os.getenv('DB_PATH', 'sellgroup.db')
-
-# Admin Authentication
-ADMIN_TOKENS = set(t.strip() for t in os.getenv('ADMIN_API_TOKENS', 'admin123').split(',') if t.strip())
-
-# Server Settings
-WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
-WEB_PORT = int(os.getenv('WEB_PORT', '8000'))
-
-# Payment Settings
-USD_RATE = 1.0
-USDT_NETWORK = 'Polygon'
-
-# Telegram API Credentials
-API_ID = int(os.getenv('TELEGRAM_API_ID', '22678810'))
-API_HASH = os.getenv('TELEGRAM_API_HASH', 'e1bae6cf96738d4f22dd7fe14c583713')
-
-# Business Rules
-MAX_GROUPS_PER_RECEIVER = 10
-MIN_WITHDRAWAL_AMOUNT = 1
-
-# Group Verification Keywords
-CRYPTO_KEYWORDS = [
-    'investment', 'ico', 'staking', 'apy', 'usdt', 'tron', 'bnb', 
-    'coin', 'token', 'presale', 'airdrop', 'btc', 'crypto', 
-    'exchange', 'binance', 'bybit'
-]
-
-LOCATION_KEYWORDS = [
-    'location', 'near', 'latitude', 'longitude', 'address', 
-    'city', 'geolocation'
-]
-
-IMPORTED_KEYWORDS = [
-    'imported', 'import from', 'migrated', 'history imported', 
-    'messages imported', 'message history', 'history was'
-]
-
-ADDED_KEYWORDS = [
-    'added', 'joined the group', 'invited', 'has joined'
-]
-
-REMOVED_KEYWORDS = [
-    'left', 'kicked', 'removed', 'banned', 'deleted'
-]
-
-# Session types
-SESSION_TYPES = [
-    'checker',
-    'receiver', 
-    'withdrawal_request',
-    'withdrawal_paid'
-]
-
-# Channel IDs (set these after creating channels)
-WITHDRAWAL_REQUEST_CHANNEL = os.getenv('WITHDRAWAL_REQUEST_CHANNEL', '')  # e.g., '@your_withdraw_requests'
-WITHDRAWAL_PAID_CHANNEL = os.getenv('WITHDRAWAL_PAID_CHANNEL', '')  # e.g., '@your_withdraw_paid'
-
-# Session Storage (in-memory)
-telegram_login_sessions = {}
+"""
+Configuration settings for Telegram Group Seller Platform
+"""
+import os
+import socket
+import tempfile
+from dotenv import load_dotenv
+load_dotenv()
+# Database
+DB_PATH = os.getenv('DB_PATH', 'sellgroup.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))  # idle connections kept open
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', str(64 * 1024)))  # page cache per connection
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', '4'))  # threads running queries for async code
+
+# Templates
+TEMPLATE_CACHE_DIR = os.getenv(  # compiled template bytecode, shared by workers and kept across restarts
+    'TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'sellgroup-templates')
+)
+TEMPLATE_AUTO_RELOAD = os.getenv('TEMPLATE_AUTO_RELOAD', '1') == '1'  # re-stat template files per render; 0 in production
+TEMPLATE_STREAM_CHUNK = 4 * 1024  # bytes of rendered HTML sent per streamed chunk
+
+# Static assets and response compression
+STATIC_DIR = 'static'
+STATIC_BUILD_DIR = 'build'  # fingerprinted, precompressed copies (python build_static.py), inside STATIC_DIR
+STATIC_IMMUTABLE_MAX_AGE = 31536000  # fingerprinted URLs never change content
+COMPRESSION_MIN_SIZE = 1024  # smaller responses are sent as-is
+COMPRESSION_LEVEL = 6
+
+# Admin Authentication
+ADMIN_TOKENS = set(t.strip() for t in os.getenv('ADMIN_API_TOKENS', 'admin123').split(',') if t.strip())
+
+# Session tokens (signed cookies)
+SESSION_SECRET = os.getenv('SESSION_SECRET', '')  # empty: generated once and kept in system_settings
+SESSION_TTL = 2592000  # 30 days
+SESSION_TOKEN_VERSION = 1  # bump to invalidate every issued token
+REVOCATION_REFRESH_SECONDS = 5  # how often each worker reloads the revocation list
+
+# Password hashing (scrypt, ~16 MB and ~50 ms per hash with these parameters)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))  # concurrent hashes
+PASSWORD_MAX_PENDING = int(os.getenv('PASSWORD_MAX_PENDING', '32'))  # queued beyond this are refused
+
+# Server Settings
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('WEB_PORT', '8000'))
+WORKER_ID = os.getenv('WORKER_ID', f'{socket.gethostname()}:{os.getpid()}')  # owner recorded on claimed work
+
+# Payment Settings
+USD_RATE = 1.0
+USDT_NETWORK = 'Polygon'
+
+# Telegram API Credentials
+API_ID = int(os.getenv('TELEGRAM_API_ID', '22678810'))
+API_HASH = os.getenv('TELEGRAM_API_HASH', 'e1bae6cf96738d4f22dd7fe14c583713')
+
+# Business Rules
+MAX_GROUPS_PER_RECEIVER = 10
+MIN_WITHDRAWAL_AMOUNT = 1
+PROFILE_PAGE_SIZE = 50  # listings per profile page / infinite-scroll batch
+CAMPAIGN_CACHE_TTL = 30  # seconds; safety net for changes made by other processes
+USER_CACHE_TTL = 10  # seconds a resolved user is reused across requests
+USER_CACHE_MAX = 10000  # users kept in memory
+IMPORT_MAX_LINES = 50000  # lines accepted per bulk import
+IMPORT_CHUNK_SIZE = 500  # listings inserted (and results streamed) per transaction
+IMPORT_READ_SIZE = 64 * 1024  # bytes read from an upload at a time
+STATUS_BATCH_MAX = 500  # listing ids accepted by one /status/batch request
+
+# Admission control
+MAX_QUEUED_LISTINGS = int(os.getenv('MAX_QUEUED_LISTINGS', '20000'))  # pending listings, all sellers
+MAX_QUEUED_PER_USER = int(os.getenv('MAX_QUEUED_PER_USER', '2000'))  # pending listings per seller
+RATE_LIMITS = {  # bucket: (requests per minute, burst)
+    'sell': (10, 10),
+    'status': (60, 30),
+    'telegram_post': (20, 3)  # outbox sends per Telegram session
+}
+THROUGHPUT_WINDOW = 3600  # seconds of completed checks the estimator looks at
+THROUGHPUT_SAMPLES = 200  # most recent checks kept
+DEFAULT_CHECK_SECONDS = 15  # assumed cycle time before any check has completed
+CHECK_CLAIM_LEASE = 900  # seconds a 'checking' listing is left to its worker before it is requeued
+CHECK_RELEASE_INTERVAL = 60  # how often each checker looks for expired claims
+
+# Server-Sent Events (listing status push)
+SSE_MAX_CONNECTIONS_PER_USER = 3  # open /events streams per seller
+SSE_HISTORY_PER_USER = 100  # recent events kept for Last-Event-ID replay
+SSE_QUEUE_SIZE = 256  # undelivered events before a slow stream is dropped
+SSE_HEARTBEAT_SECONDS = 15
+
+# Outbox (outbound Telegram posts)
+OUTBOX_BATCH = 20  # due posts taken per dispatcher pass
+OUTBOX_POLL_SECONDS = 5  # idle dispatcher wakes this often (enqueues wake it at once)
+OUTBOX_BACKOFF_BASE = 5  # seconds before the first retry, doubled per failed attempt
+OUTBOX_BACKOFF_MAX = 3600  # retries never stop, but are at most this far apart
+OUTBOX_SEND_LEASE = 600  # seconds a claimed send is left to its worker before another may retry it
+TELEGRAM_MESSAGE_LIMIT = 4096  # characters per Telegram message
+TELEGRAM_PART_DELAY = 1.0  # seconds between the parts of one multi-message post (flood limits)
+PAYOUT_BATCH_MAX = 5000  # withdrawals accepted by one /admin/payouts/batch request
+
+# Balance ledger
+LEDGER_RECONCILE_SECONDS = 60  # how often balances are checked against the ledger
+LEDGER_RECONCILE_BATCH = 500  # users re-checked per pass besides those with new entries
+
+# Keyed locks (transfer / withdrawal critical sections)
+LOCK_MAX_KEYS = 10000  # listings and users locked at once, per worker
+LOCK_WAIT_SECONDS = 30  # longest a request waits for another on the same key (Telegram checks included)
+
+# Group Verification Keywords
+CRYPTO_KEYWORDS = [
+    'investment', 'ico', 'staking', 'apy', 'usdt', 'tron', 'bnb', 
+    'coin', 'token', 'presale', 'airdrop', 'btc', 'crypto', 
+    'exchange', 'binance', 'bybit'
+]
+
+LOCATION_KEYWORDS = [
+    'location', 'near', 'latitude', 'longitude', 'address', 
+    'city', 'geolocation'
+]
+
+IMPORTED_KEYWORDS = [
+    'imported', 'import from', 'migrated', 'history imported', 
+    'messages imported', 'message history', 'history was'
+]
+
+ADDED_KEYWORDS = [
+    'added', 'joined the group', 'invited', 'has joined'
+]
+
+REMOVED_KEYWORDS = [
+    'left', 'kicked', 'removed', 'banned', 'deleted'
+]
+
+# Listing statuses, in lifecycle order
+LISTING_STATUSES = [
+    'pending',
+    'checking',
+    'ready_for_transfer',
+    'sold',
+    'failed'
+]
+
+# Session types
+SESSION_TYPES = [
+    'checker',
+    'receiver', 
+    'withdrawal_request',
+    'withdrawal_paid'
+]
+
+# Channel IDs (set these after creating channels)
+WITHDRAWAL_REQUEST_CHANNEL = os.getenv('WITHDRAWAL_REQUEST_CHANNEL', '')  # e.g., '@your_withdraw_requests'
+WITHDRAWAL_PAID_CHANNEL = os.getenv('WITHDRAWAL_PAID_CHANNEL', '')  # e.g., '@your_withdraw_paid'
+
+# Session Storage (in-memory)
+telegram_login_sessions = {}
 active_telegram_clients = {}
\ No newline at end of file
@@ -1,255 +1,318 @@
-"""
-Database operations and schema management
-"""
-import sqlite3
-import hashlib
-from typing import Optional, Dict, Any
-from config import DB_PATH
-
-
-def get_connection():
-    """Get database connection"""
-    return sqlite3.connect(DB_PATH)
-
-
-def init_database():
-    """Initialize database schema"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            telegram_username TEXT,
-            usdt_wallet TEXT,
-            balance REAL DEFAULT 0,
-            created_ts INTEGER NOT NULL,
-            is_admin INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Campaigns table - UPDATED WITH MONTH COLUMN
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS campaigns (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            year INTEGER NOT NULL,
-            month INTEGER,                    -- ADDED MONTH COLUMN
-            price_usd REAL NOT NULL,
-            target_count INTEGER NOT NULL,
-            sold_count INTEGER DEFAULT 0,
-            created_ts INTEGER NOT NULL
-        )
-    ''')
-    
-    # System settings table for tracking round-robin state
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS system_settings (
-            key TEXT PRIMARY KEY,
-            value TEXT
-        )
-    ''')
-
-    # Listings table - UPDATED with included_in_withdrawal column
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS listings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            campaign_id INTEGER NOT NULL,
-            group_link TEXT NOT NULL,
-            seller_tg TEXT,
-            seller_usdt TEXT,
-            price_usd REAL NOT NULL,
-            status TEXT NOT NULL,
-            check_reason TEXT,
-            check_log TEXT,
-            checked_by_session INTEGER,
-            receiver_session INTEGER,
-            created_ts INTEGER NOT NULL,
-            transferred_ts INTEGER,
-            included_in_withdrawal INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (campaign_id) REFERENCES campaigns(id)
-        )
-    ''')
-    
-    # Withdrawals table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS withdrawals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            seller_usdt TEXT NOT NULL,
-            amount_usdt REAL NOT NULL,
-            status TEXT DEFAULT 'pending',
-            txid TEXT,
-            created_ts INTEGER NOT NULL,
-            paid_ts INTEGER,
-            withdrawal_request_msg_id INTEGER,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Admin sessions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_text TEXT NOT NULL,
-            username TEXT NOT NULL,
-            session_type TEXT DEFAULT 'checker',
-            status TEXT NOT NULL,
-            groups_received INTEGER DEFAULT 0,
-            last_used_ts INTEGER,
-            channel_id TEXT
-        )
-    ''')
-    
-    # ADD MISSING COLUMNS if they don't exist
-    try:
-        cursor.execute("ALTER TABLE listings ADD COLUMN included_in_withdrawal INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        cursor.execute("ALTER TABLE admin_sessions ADD COLUMN channel_id TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    try:
-        cursor.execute("ALTER TABLE withdrawals ADD COLUMN withdrawal_request_msg_id INTEGER")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    try:
-        cursor.execute("ALTER TABLE campaigns ADD COLUMN month INTEGER")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully")
-
-
-def hash_password(password: str) -> str:
-    """Hash password using SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-
-# User operations
-def create_user(username: str, password: str, telegram_username: str, usdt_wallet: str, created_ts: int) -> Optional[int]:
-    """Create new user"""
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO users (username, password_hash, telegram_username, usdt_wallet, created_ts) VALUES (?, ?, ?, ?, ?)',
-            (username, hash_password(password), telegram_username, usdt_wallet, created_ts)
-        )
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return user_id
-    except sqlite3.IntegrityError:
-        return None
-
-
-def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
-    """Get user by ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT id, username, balance, telegram_username, usdt_wallet, created_ts, is_admin FROM users WHERE id = ?',
-        (user_id,)
-    )
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            'id': row[0],
-            'username': row[1],
-            'balance': round(row[2], 2),
-            'telegram_username': row[3],
-            'usdt_wallet': row[4],
-            'created_ts': row[5],
-            'is_admin': row[6]
-        }
-    return None
-
-
-def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
-    """Get user by username (for login)"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT id, password_hash FROM users WHERE username = ?',
-        (username,)
-    )
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            'id': row[0],
-            'password_hash': row[1]
-        }
-    return None
-
-
-def verify_user_password(username: str, password: str) -> Optional[int]:
-    """Verify user credentials and return user ID"""
-    user = get_user_by_username(username)
-    if user and user['password_hash'] == hash_password(password):
-        return user['id']
-    return None
-
-
-# Campaign operations
-def get_all_campaigns():
-    """Get all campaigns"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT id, title, year, price_usd, target_count, sold_count FROM campaigns ORDER BY id DESC'
-    )
-    campaigns = []
-    for row in cursor.fetchall():
-        progress = min(100, int((row[5] / row[4]) * 100) if row[4] > 0 else 0)
-        campaigns.append({
-            'id': row[0],
-            'title': row[1],
-            'year': row[2],
-            'price_usd': row[3],
-            'target_count': row[4],
-            'sold_count': row[5],
-            'progress': progress
-        })
-    conn.close()
-    return campaigns
-
-
-def get_campaign_by_id(campaign_id: int):
-    """Get campaign by ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT id, title, year, price_usd FROM campaigns WHERE id = ?',
-        (campaign_id,)
-    )
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        return {
-            'id': row[0],
-            'title': row[1],
-            'year': row[2],
-            'price_usd': row[3]
-        }
-    return None
-
-
-if __name__ == '__main__':
-    # Initialize database when run directly
+"""
+Database operations and schema management
+"""
+import sqlite3
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+from config import (
+    DB_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_MMAP_SIZE, DB_CACHE_SIZE_KB,
+    DB_EXECUTOR_WORKERS
+)
+from migrations import migrate
+from passwords import hash_password
+
+
+# Connection pool
+# Idle connections are shared by every thread and task; a connection is owned
+# by exactly one caller between get_connection() and close().
+_pool_lock = threading.Lock()
+_idle_connections = []
+
+
+class PooledConnection:
+    """
+    Drop-in wrapper around sqlite3.Connection.
+    close() hands the connection back to the pool instead of closing it.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_released', False)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        """Return connection to the pool (uncommitted changes are rolled back)"""
+        if self._released:
+            return
+        object.__setattr__(self, '_released', True)
+        _release_connection(self._conn)
+
+
+def _open_connection() -> sqlite3.Connection:
+    """Open a new connection with WAL mode and tuned pragmas"""
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')  # readers no longer block on the worker's writes
+    conn.execute('PRAGMA synchronous=NORMAL')  # safe with WAL, fsync only at checkpoints
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def _release_connection(conn: sqlite3.Connection):
+    """Reset a connection and put it back into the idle pool"""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+    except sqlite3.Error:
+        conn.close()
+        return
+
+    with _pool_lock:
+        if len(_idle_connections) < DB_POOL_SIZE:
+            _idle_connections.append(conn)
+            return
+    conn.close()
+
+
+def get_connection():
+    """Get database connection from the pool"""
+    with _pool_lock:
+        conn = _idle_connections.pop() if _idle_connections else None
+    if conn is None:
+        conn = _open_connection()
+    return PooledConnection(conn)
+
+
+def close_all_connections():
+    """Close every idle pooled connection (shutdown / database reset)"""
+    with _pool_lock:
+        connections = _idle_connections[:]
+        _idle_connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+# Async access layer
+# Every query issued from a coroutine goes through this executor so the event
+# loop (Telegram RPCs, HTTP handlers) never waits on disk.
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db')
+
+
+async def run_db(func: Callable, *args, **kwargs):
+    """Run a blocking database function on the database executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+
+def _in_transaction(func: Callable, args: tuple, kwargs: dict, immediate: bool = False):
+    """Call func(cursor, ...) on a pooled connection, commit on success"""
+    conn = get_connection()
+    try:
+        if immediate:
+            conn.execute('BEGIN IMMEDIATE')
+        result = func(conn.cursor(), *args, **kwargs)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+async def run_transaction(func: Callable, *args, **kwargs):
+    """Run func(cursor, *args) as one transaction on the database executor"""
+    return await run_db(_in_transaction, func, args, kwargs)
+
+
+async def run_immediate(func: Callable, *args, **kwargs):
+    """
+    run_transaction, but take the write lock up front: for read-then-write
+    decisions (e.g. counting free slots before inserting) that must not interleave
+    """
+    return await run_db(_in_transaction, func, args, kwargs, immediate=True)
+
+
+async def fetch_one(query: str, params: tuple = ()):
+    """Run a query and return the first row"""
+    return await run_transaction(lambda cursor: cursor.execute(query, params).fetchone())
+
+
+async def fetch_all(query: str, params: tuple = ()):
+    """Run a query and return all rows"""
+    return await run_transaction(lambda cursor: cursor.execute(query, params).fetchall())
+
+
+async def execute(query: str, params: tuple = ()) -> int:
+    """Run a write statement and return the affected row count"""
+    return await run_transaction(lambda cursor: cursor.execute(query, params).rowcount)
+
+
+def init_database():
+    """Bring the database schema up to date"""
+    conn = get_connection()
+    try:
+        version = migrate(conn)
+    finally:
+        conn.close()
+    print(f"Database initialized successfully (schema v{version})")
+
+
+# User operations
+def create_user(username: str, password: str, telegram_username: str, usdt_wallet: str, created_ts: int) -> Optional[int]:
+    """Create new user (hashes inline; async code should use insert_user with hash_password_async)"""
+    return insert_user(username, hash_password(password), telegram_username, usdt_wallet, created_ts)
+
+
+def insert_user(username: str, password_hash: str, telegram_username: str, usdt_wallet: str, created_ts: int) -> Optional[int]:
+    """Insert a user with an already computed password hash"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO users (username, password_hash, telegram_username, usdt_wallet, created_ts) VALUES (?, ?, ?, ?, ?)',
+            (username, password_hash, telegram_username, usdt_wallet, created_ts)
+        )
+        user_id = cursor.lastrowid
+        conn.commit()
+        return user_id
+    except sqlite3.IntegrityError:
+        return None
+    finally:
+        conn.close()
+
+
+def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+    """Get user by ID"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, username, balance_cents, telegram_username, usdt_wallet, created_ts, is_admin FROM users WHERE id = ?',
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    
+    if row:
+        return {
+            'id': row[0],
+            'username': row[1],
+            'balance': row[2] / 100,
+            'telegram_username': row[3],
+            'usdt_wallet': row[4],
+            'created_ts': row[5],
+            'is_admin': row[6]
+        }
+    return None
+
+
+def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
+    """Get user by username (for login)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, password_hash FROM users WHERE username = ?',
+        (username,)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    
+    if row:
+        return {
+            'id': row[0],
+            'password_hash': row[1]
+        }
+    return None
+
+
+def update_password_hash(user_id: int, old_hash: str, new_hash: str) -> bool:
+    """Swap in an upgraded hash, unless the password changed in the meantime"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+            (new_hash, user_id, old_hash)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+
+def get_or_create_setting(key: str, default: str) -> str:
+    """Read a system setting, storing the default first if it is not set yet"""
+    conn = get_connection()
+    try:
+        conn.execute('INSERT OR IGNORE INTO system_settings (key, value) VALUES (?, ?)', (key, default))
+        conn.commit()
+        return conn.execute('SELECT value FROM system_settings WHERE key = ?', (key,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+# Campaign operations
+def get_all_campaigns():
+    """Get all campaigns, newest first, with progress precomputed"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, title, year, month, price_usd, target_count, sold_count, priority, expedite '
+        'FROM campaigns ORDER BY id DESC'
+    )
+    campaigns = []
+    for row in cursor.fetchall():
+        target_count = row[5]
+        sold_count = row[6]
+        progress = min(100, int((sold_count / target_count) * 100) if target_count > 0 else 0)
+        campaigns.append({
+            'id': row[0],
+            'title': row[1],
+            'year': row[2],
+            'month': row[3],
+            'price_usd': row[4],
+            'target_count': target_count,
+            'sold_count': sold_count,
+            'progress': progress,
+            'priority': row[7],
+            'expedite': row[8]
+        })
+    conn.close()
+    return campaigns
+
+
+def get_campaign_by_id(campaign_id: int):
+    """Get campaign by ID"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id, title, year, price_usd FROM campaigns WHERE id = ?',
+        (campaign_id,)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    
+    if row:
+        return {
+            'id': row[0],
+            'title': row[1],
+            'year': row[2],
+            'price_usd': row[3]
+        }
+    return None
+
+
+if __name__ == '__main__':
+    # Initialize database when run directly
     init_database()
\ No newline at end of file
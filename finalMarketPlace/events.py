@@ -0,0 +1,141 @@
+"""
+In-process pub/sub of listing status changes, streamed to sellers as Server-Sent Events
+"""
+import json
+import time
+import asyncio
+import itertools
+from collections import deque
+from typing import Dict, Set, Optional, Iterator
+from config import (
+    SSE_HISTORY_PER_USER, SSE_MAX_CONNECTIONS_PER_USER, SSE_QUEUE_SIZE, SSE_HEARTBEAT_SECONDS, USER_CACHE_MAX
+)
+
+# Event ids only ever increase, across restarts too (they start at the clock in ms).
+# They are shared by all users, so one user's ids have gaps.
+_first_id = int(time.time() * 1000)
+_event_ids = itertools.count(_first_id)
+
+# Recent events per user for Last-Event-ID replay: {user_id: deque[(id, event, data)]}
+_history: Dict[int, deque] = {}
+
+# Id of the newest event dropped from each user's buffer: {user_id: event_id}
+_evicted: Dict[int, int] = {}
+
+# Events up to this id may have gone unbuffered for users without a _history entry
+# (published by an earlier process, or the user's buffer was pruned)
+_forgotten_through = _first_id - 1
+
+# Open streams per user
+_subscribers: Dict[int, Set[asyncio.Queue]] = {}
+
+
+def publish(user_id: int, event: str, data: dict):
+    """Send an event to every open stream of the user (never blocks)"""
+    global _forgotten_through
+    entry = (next(_event_ids), event, data)
+    
+    history = _history.get(user_id)
+    if history is None:
+        if len(_history) >= USER_CACHE_MAX:
+            # Users without an open stream reload on their next visit anyway
+            _forgotten_through = entry[0] - 1
+            for idle in [uid for uid in _history if uid not in _subscribers]:
+                del _history[idle]
+                del _evicted[idle]
+        history = _history[user_id] = deque(maxlen=SSE_HISTORY_PER_USER)
+        _evicted[user_id] = _forgotten_through
+    if len(history) == history.maxlen:
+        _evicted[user_id] = history[0][0]
+    history.append(entry)
+
+    for queue in list(_subscribers.get(user_id, ())):
+        try:
+            queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            # Slow consumer: end its stream, the browser reconnects and replays
+            _subscribers[user_id].discard(queue)
+            queue.get_nowait()
+            queue.put_nowait(None)
+
+
+def publish_status(user_id: int, listing_id: int, status: str, **extra):
+    """Publish a listing status transition"""
+    publish(user_id, 'status', {'listing_id': listing_id, 'status': status, **extra})
+
+
+def at_capacity(user_id: int) -> bool:
+    """True when the user already has SSE_MAX_CONNECTIONS_PER_USER open streams"""
+    return len(_subscribers.get(user_id, ())) >= SSE_MAX_CONNECTIONS_PER_USER
+
+
+def subscribe(user_id: int) -> Optional[asyncio.Queue]:
+    """Open a stream for the user, or None when they are at the connection cap"""
+    queues = _subscribers.setdefault(user_id, set())
+    if len(queues) >= SSE_MAX_CONNECTIONS_PER_USER:
+        return None
+    queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+    queues.add(queue)
+    return queue
+
+
+def unsubscribe(user_id: int, queue: asyncio.Queue):
+    """Close a stream"""
+    queues = _subscribers.get(user_id)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            del _subscribers[user_id]
+
+
+def _replay(user_id: int, last_event_id: Optional[int]) -> Iterator[tuple]:
+    """Events missed since last_event_id; a 'resync' event if they fell out of the buffer"""
+    if last_event_id is None:
+        return
+    # Only an event newer than last_event_id that is no longer buffered was missed
+    if last_event_id < _evicted.get(user_id, _forgotten_through):
+        yield (last_event_id, 'resync', {})
+    for entry in _history.get(user_id, ()):
+        if entry[0] > last_event_id:
+            yield entry
+
+
+def _format(entry: tuple) -> str:
+    event_id, event, data = entry
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream(user_id: int, last_event_id: Optional[int]):
+    """
+    SSE body for one subscriber: replay, then live events with keep-alive comments
+    Subscribes here rather than in the handler, so a response that is never sent
+    leaves nothing registered
+    """
+    queue = subscribe(user_id)
+    if queue is None:
+        # Another stream took the last slot after the handler's at_capacity check
+        yield 'retry: 5000\n\n'
+        return
+    
+    sent = last_event_id or 0
+    try:
+        yield 'retry: 5000\n\n'
+        for entry in _replay(user_id, last_event_id):
+            sent = entry[0]
+            yield _format(entry)
+
+        while True:
+            try:
+                entry = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if entry is None:
+                break
+            # Published between subscribe() and the replay above
+            if entry[0] <= sent:
+                continue
+            sent = entry[0]
+            yield _format(entry)
+    finally:
+        unsubscribe(user_id, queue)
@@ -0,0 +1,28 @@
+"""
+Rendered HTML of the shared page regions built only from campaigns (grids, anonymous pages)
+"""
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+from markupsafe import Markup
+
+from campaign_cache import cached_version
+
+# {key: (campaign version rendered from, html)}
+_fragments: Dict[Hashable, Tuple[int, str]] = {}
+
+
+async def cached_fragment(key: Hashable, campaigns: list, render: Callable[[], Awaitable[str]]) -> Markup:
+    """
+    Rendered HTML for key, re-rendered only when the campaign data version changes
+    campaigns: the list from get_campaigns() the fragment is rendered from
+    render: renders the fragment; must not use anything user-specific
+    """
+    version = cached_version(campaigns)
+    hit = _fragments.get(key)
+    if hit is not None and hit[0] == version:
+        return Markup(hit[1])
+
+    html = await render()
+    # Never store HTML rendered from a list that was invalidated meanwhile
+    if version is not None and version == cached_version(campaigns):
+        _fragments[key] = (version, html)
+    return Markup(html)
@@ -0,0 +1,118 @@
+"""
+Append-only balance ledger in integer cents
+
+Every balance change is a balance_ledger entry written in the same
+transaction as the change; users.balance_cents (and the legacy REAL
+users.balance) is the materialized sum, so balance reads stay one row.
+The reconciliation job checks the two incrementally from per-user checkpoints.
+"""
+import time
+import asyncio
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Tuple
+
+from config import LEDGER_RECONCILE_SECONDS, LEDGER_RECONCILE_BATCH
+from database import run_immediate
+
+RECONCILED_KEY = 'ledger_reconciled_id'  # last entry id whose user was checked
+SWEEP_KEY = 'ledger_sweep_user'  # rolling pass over all users (catches edits outside the ledger)
+
+
+class InsufficientBalance(Exception):
+    """A debit would take the balance below zero (the transaction is rolled back)"""
+
+
+def to_cents(amount) -> int:
+    """Dollars (float, str or Decimal) to integer cents, rounding half up"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def post_entry(cursor, user_id: int, amount_cents: int, kind: str, ref_id: int = None):
+    """
+    Record a balance change and apply it to the materialized balance
+    Raises InsufficientBalance for a debit larger than the balance
+    """
+    cursor.execute(
+        '''UPDATE users SET balance_cents = balance_cents + ?, balance = (balance_cents + ?) / 100.0
+           WHERE id = ? AND balance_cents + ? >= 0''',
+        (amount_cents, amount_cents, user_id, amount_cents)
+    )
+    if cursor.rowcount == 0:
+        raise InsufficientBalance(f"User {user_id} cannot be debited {-amount_cents} cents")
+    
+    cursor.execute(
+        'INSERT INTO balance_ledger (user_id, amount_cents, kind, ref_id, created_ts) VALUES (?, ?, ?, ?, ?)',
+        (user_id, amount_cents, kind, ref_id, int(time.time()))
+    )
+
+
+def _setting(cursor, key: str) -> int:
+    cursor.execute('SELECT value FROM system_settings WHERE key = ?', (key,))
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def _set_setting(cursor, key: str, value: int):
+    cursor.execute('REPLACE INTO system_settings (key, value) VALUES (?, ?)', (key, str(value)))
+
+
+def _check_user(cursor, user_id: int, top_id: int):
+    """Ledger sum (checkpoint + newer entries) vs the materialized balance; moves the checkpoint"""
+    cursor.execute('SELECT through_id, balance_cents FROM ledger_checkpoints WHERE user_id = ?', (user_id,))
+    through_id, ledger_cents = cursor.fetchone() or (0, 0)
+    
+    cursor.execute(
+        'SELECT COALESCE(SUM(amount_cents), 0) FROM balance_ledger WHERE user_id = ? AND id > ? AND id <= ?',
+        (user_id, through_id, top_id)
+    )
+    ledger_cents += cursor.fetchone()[0]
+    cursor.execute(
+        'REPLACE INTO ledger_checkpoints (user_id, through_id, balance_cents) VALUES (?, ?, ?)',
+        (user_id, top_id, ledger_cents)
+    )
+    
+    cursor.execute('SELECT balance_cents FROM users WHERE id = ?', (user_id,))
+    row = cursor.fetchone()
+    cached_cents = row[0] if row else 0
+    return None if cached_cents == ledger_cents else (user_id, ledger_cents, cached_cents)
+
+
+def reconcile(cursor) -> Tuple[int, List[tuple]]:
+    """
+    One incremental pass: users with entries since the last pass, plus the
+    next LEDGER_RECONCILE_BATCH users of a rolling sweep
+    Run under run_immediate so no entry commits between its reads
+    Returns: (users checked, [(user_id, ledger_cents, cached_cents)] that disagree)
+    """
+    last_id = _setting(cursor, RECONCILED_KEY)
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM balance_ledger')
+    top_id = cursor.fetchone()[0]
+    
+    cursor.execute('SELECT DISTINCT user_id FROM balance_ledger WHERE id > ? AND id <= ?', (last_id, top_id))
+    user_ids = {row[0] for row in cursor.fetchall()}
+    
+    sweep_from = _setting(cursor, SWEEP_KEY)
+    cursor.execute('SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?', (sweep_from, LEDGER_RECONCILE_BATCH))
+    swept = [row[0] for row in cursor.fetchall()]
+    user_ids.update(swept)
+    
+    mismatches = [m for m in (_check_user(cursor, uid, top_id) for uid in sorted(user_ids)) if m]
+    
+    _set_setting(cursor, RECONCILED_KEY, top_id)
+    _set_setting(cursor, SWEEP_KEY, swept[-1] if len(swept) == LEDGER_RECONCILE_BATCH else 0)
+    return len(user_ids), mismatches
+
+
+async def reconciliation_worker():
+    """Background task: compare materialized balances with the ledger"""
+    while True:
+        try:
+            # Write lock up front: a sale committing between reading top_id and
+            # users.balance_cents would otherwise show up as a false mismatch
+            checked, mismatches = await run_immediate(reconcile)
+            for user_id, ledger_cents, cached_cents in mismatches:
+                print(f"Ledger mismatch for user {user_id}: ledger {ledger_cents / 100:.2f}, balance {cached_cents / 100:.2f}")
+        except Exception as e:
+            print(f"Ledger reconciliation error: {e}")
+        
+        await asyncio.sleep(LEDGER_RECONCILE_SECONDS)
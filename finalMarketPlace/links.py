@@ -0,0 +1,69 @@
+"""
+Telegram group link parsing, shared by every call site that needs a username or invite hash
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+_INVITE_RE = re.compile(
+    r'^(?:https?://)?(?:www\.)?(?:t|telegram)\.me/(?:joinchat/|\+)([A-Za-z0-9_-]{8,64})/?(?:\?.*)?$',
+    re.IGNORECASE
+)
+_PUBLIC_RE = re.compile(
+    r'^(?:https?://)?(?:www\.)?(?:t|telegram)\.me/(?:s/)?([A-Za-z][A-Za-z0-9_]{4,31})(?:/\d+)?/?(?:\?.*)?$',
+    re.IGNORECASE
+)
+_MENTION_RE = re.compile(r'^@([A-Za-z][A-Za-z0-9_]{4,31})$')
+_FOLDER_RE = re.compile(r'(?:t|telegram)\.me/addlist/', re.IGNORECASE)
+
+# t.me paths that look like usernames but are not groups
+_RESERVED_PATHS = {'joinchat', 'addlist', 'addstickers', 'addemoji', 'share', 'proxy', 'socks', 'login', 'iv'}
+
+
+class TelegramLink(NamedTuple):
+    """A parsed group link; kind is 'public', 'invite', 'folder' or 'invalid'"""
+    kind: str
+    username: Optional[str] = None
+    invite_hash: Optional[str] = None
+    canonical: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.kind in ('public', 'invite')
+
+    @property
+    def peer(self) -> str:
+        """What to pass to Telethon: the username or the invite hash"""
+        return self.username or self.invite_hash
+
+
+@lru_cache(maxsize=65536)
+def parse_link(raw: str) -> TelegramLink:
+    """
+    Parse t.me / telegram.me / https:// / @name forms into one canonical record
+    Canonical form: t.me/<username> (lowercased) or t.me/+<hash> (hashes are case-sensitive)
+    """
+    link = raw.strip().strip('"\'')
+    if not link:
+        return TelegramLink('invalid', error='empty')
+    if len(link) > 256:
+        return TelegramLink('invalid', error='too long')
+    if _FOLDER_RE.search(link):
+        return TelegramLink('folder', error='folder links are not accepted')
+
+    match = _INVITE_RE.match(link)
+    if match:
+        invite_hash = match.group(1)
+        if invite_hash.isdigit():
+            return TelegramLink('invalid', error='phone number links are not groups')
+        return TelegramLink('invite', invite_hash=invite_hash, canonical=f"t.me/+{invite_hash}")
+
+    match = _PUBLIC_RE.match(link) or _MENTION_RE.match(link)
+    if match:
+        username = match.group(1).lower()
+        if username in _RESERVED_PATHS:
+            return TelegramLink('invalid', error='not a group link')
+        return TelegramLink('public', username=username, canonical=f"t.me/{username}")
+
+    return TelegramLink('invalid', error='not a Telegram group link')
@@ -0,0 +1,70 @@
+"""
+Keyed async locks and single-flight calls for per-listing / per-user critical sections
+
+Entries exist only while a request holds or waits on them, so the tables
+stay as small as the number of keys in use; both are capped at LOCK_MAX_KEYS.
+These only serialize requests within one worker process: the database
+writes behind them are still conditional (UPDATE ... WHERE status=?), which
+is what keeps separate workers from applying a change twice.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from config import LOCK_MAX_KEYS, LOCK_WAIT_SECONDS
+
+# {key: [lock, holders + waiters]}
+_locks: Dict[Hashable, List] = {}
+
+# {key: task of the call in flight}
+_inflight: Dict[Hashable, asyncio.Task] = {}
+
+
+class LockBusy(Exception):
+    """The key stayed locked for LOCK_WAIT_SECONDS, or too many keys are locked"""
+
+
+@asynccontextmanager
+async def hold(key: Hashable, timeout: float = LOCK_WAIT_SECONDS):
+    """Run the block with exclusive use of key; raises LockBusy instead of waiting forever"""
+    entry = _locks.get(key)
+    if entry is None:
+        if len(_locks) >= LOCK_MAX_KEYS:
+            raise LockBusy('Too many operations in progress')
+        entry = _locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+
+    try:
+        try:
+            await asyncio.wait_for(entry[0].acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise LockBusy('Another request for this item is still running')
+        try:
+            yield
+        finally:
+            entry[0].release()
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _locks[key]
+
+
+def _finished(key: Hashable, task: asyncio.Task):
+    del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # retrieved here so a failure nobody waited for is not logged as lost
+
+
+async def single_flight(key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run func once per key at a time: calls arriving while it runs wait for
+    and share its result (or exception) instead of starting another
+    """
+    task = _inflight.get(key)
+    if task is None:
+        if len(_inflight) >= LOCK_MAX_KEYS:
+            raise LockBusy('Too many operations in progress')
+        # Own task: a caller disconnecting must not cancel the work the others wait on
+        task = _inflight[key] = asyncio.ensure_future(func())
+        task.add_done_callback(lambda t: _finished(key, t))
+    return await asyncio.shield(task)
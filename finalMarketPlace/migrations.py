@@ -0,0 +1,386 @@
+"""
+Versioned schema migrations tracked with PRAGMA user_version
+"""
+from typing import Optional
+
+
+def _add_column_if_missing(cursor, table: str, column: str, definition: str):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _001_base_schema(cursor):
+    """Original tables, plus the columns databases created before them lack"""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            telegram_username TEXT,
+            usdt_wallet TEXT,
+            balance REAL DEFAULT 0,
+            created_ts INTEGER NOT NULL,
+            is_admin INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Campaigns table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER,
+            price_usd REAL NOT NULL,
+            target_count INTEGER NOT NULL,
+            sold_count INTEGER DEFAULT 0,
+            created_ts INTEGER NOT NULL
+        )
+    ''')
+
+    # System settings table for tracking round-robin state
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    # Listings table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS listings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            campaign_id INTEGER NOT NULL,
+            group_link TEXT NOT NULL,
+            seller_tg TEXT,
+            seller_usdt TEXT,
+            price_usd REAL NOT NULL,
+            status TEXT NOT NULL,
+            check_reason TEXT,
+            check_log TEXT,
+            checked_by_session INTEGER,
+            receiver_session INTEGER,
+            created_ts INTEGER NOT NULL,
+            transferred_ts INTEGER,
+            included_in_withdrawal INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (campaign_id) REFERENCES campaigns(id)
+        )
+    ''')
+
+    # Withdrawals table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS withdrawals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            seller_usdt TEXT NOT NULL,
+            amount_usdt REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            txid TEXT,
+            created_ts INTEGER NOT NULL,
+            paid_ts INTEGER,
+            withdrawal_request_msg_id INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    # Admin sessions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_text TEXT NOT NULL,
+            username TEXT NOT NULL,
+            session_type TEXT DEFAULT 'checker',
+            status TEXT NOT NULL,
+            groups_received INTEGER DEFAULT 0,
+            last_used_ts INTEGER,
+            channel_id TEXT
+        )
+    ''')
+
+    # Columns added after the first release
+    _add_column_if_missing(cursor, 'listings', 'included_in_withdrawal', 'INTEGER DEFAULT 0')
+    _add_column_if_missing(cursor, 'admin_sessions', 'channel_id', 'TEXT')
+    _add_column_if_missing(cursor, 'withdrawals', 'withdrawal_request_msg_id', 'INTEGER')
+    _add_column_if_missing(cursor, 'campaigns', 'month', 'INTEGER')
+
+
+def _002_hot_path_indexes(cursor):
+    """Indexes for the queue, per-user listing, withdrawal and session lookups"""
+    # checker_worker: status='pending' ORDER BY created_ts LIMIT 1
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_status_created ON listings(status, created_ts)')
+    # /, /profile: user_id=? ORDER BY created_ts DESC, COUNT(*) per user
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_user_created ON listings(user_id, created_ts)')
+    # /profile sold count, /withdraw unpaid sold groups ORDER BY transferred_ts
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_listings_user_status '
+        'ON listings(user_id, status, included_in_withdrawal, transferred_ts)'
+    )
+    # /profile, /withdraw: user_id=? ORDER BY created_ts DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_user_created ON withdrawals(user_id, created_ts)')
+    # /admin: status='pending' (covering, the dashboard never touches the table)
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_withdrawals_status_created '
+        'ON withdrawals(status, created_ts, seller_usdt, amount_usdt)'
+    )
+    # checker/receiver/withdrawal session pickers
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_admin_sessions_type_status '
+        'ON admin_sessions(session_type, status, last_used_ts)'
+    )
+
+
+def _003_profile_status_index(cursor):
+    """Index for the status-filtered, keyset-paginated profile listing"""
+    # /profile?status=: user_id=? AND status=? ORDER BY created_ts DESC, id DESC
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_listings_user_status_created '
+        'ON listings(user_id, status, created_ts)'
+    )
+
+
+def _004_revoked_sessions(cursor):
+    """Server-side revocation list for signed session tokens"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_sessions (
+            jti TEXT PRIMARY KEY,
+            expires_ts INTEGER NOT NULL
+        )
+    ''')
+    # Revocation refresh and purge: expires_ts > now / expires_ts <= now
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_revoked_sessions_expires ON revoked_sessions(expires_ts)')
+
+
+def _005_campaign_slots_index(cursor):
+    """Index for per-campaign slot accounting"""
+    # campaign_slots: campaign_id=? AND status IN (...) counts
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_campaign_status ON listings(campaign_id, status)')
+
+
+def _006_fair_scheduler(cursor):
+    """Virtual-time, priority and expedite columns for the seller-fair scheduler"""
+    _add_column_if_missing(cursor, 'listings', 'vtime', 'REAL DEFAULT 0')
+    _add_column_if_missing(cursor, 'listings', 'expedite', 'INTEGER DEFAULT 0')
+    _add_column_if_missing(cursor, 'campaigns', 'priority', 'INTEGER DEFAULT 1')
+    _add_column_if_missing(cursor, 'campaigns', 'expedite', 'INTEGER DEFAULT 0')
+
+    # Already queued listings keep FIFO order: equal vtime, ties broken by id
+    cursor.execute("UPDATE listings SET vtime = 0 WHERE vtime IS NULL")
+
+    # scheduler.claim_next: status='pending' ORDER BY expedite DESC, vtime, id LIMIT 1
+    # (status leads so the planner never prefers idx_listings_status_created + sort)
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_listings_queue '
+        'ON listings(status, expedite DESC, vtime, id)'
+    )
+    # scheduler.next_vtimes: MAX(vtime) of one seller's pending listings
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_listings_pending_user '
+        "ON listings(user_id, vtime) WHERE status = 'pending'"
+    )
+
+
+def _007_listing_updated_ts(cursor):
+    """Per-listing change timestamp (ms) for conditional /status/batch polls"""
+    _add_column_if_missing(cursor, 'listings', 'updated_ts', 'INTEGER DEFAULT 0')
+    cursor.execute(
+        'UPDATE listings SET updated_ts = COALESCE(transferred_ts, created_ts) * 1000 WHERE updated_ts = 0'
+    )
+
+    # Maintained by SQLite so no code path that changes a listing can forget it.
+    # The column list excludes updated_ts, so the trigger does not re-fire itself.
+    now_ms = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_listings_touch_insert AFTER INSERT ON listings
+        BEGIN
+            UPDATE listings SET updated_ts = {now_ms} WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_listings_touch_update
+        AFTER UPDATE OF status, check_reason, check_log, receiver_session ON listings
+        BEGIN
+            UPDATE listings SET updated_ts = {now_ms} WHERE id = NEW.id;
+        END
+    ''')
+
+
+def _008_outbox(cursor):
+    """Transactional outbox for outbound Telegram posts"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            session_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_ts REAL NOT NULL,
+            last_error TEXT,
+            created_ts INTEGER NOT NULL,
+            sent_ts INTEGER
+        )
+    ''')
+    # outbox.dispatch: due pending posts in order
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_ts, id)'
+    )
+
+
+def _009_withdrawal_messages(cursor):
+    """Channel message ids of every part of a chunked withdrawal request post"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS withdrawal_messages (
+            withdrawal_id INTEGER NOT NULL,
+            part INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            PRIMARY KEY (withdrawal_id, part),
+            FOREIGN KEY (withdrawal_id) REFERENCES withdrawals(id)
+        )
+    ''')
+
+
+def _010_balance_ledger(cursor):
+    """Append-only balance ledger in integer cents, materialized into users.balance_cents"""
+    _add_column_if_missing(cursor, 'users', 'balance_cents', 'INTEGER DEFAULT 0')
+    cursor.execute('UPDATE users SET balance_cents = CAST(ROUND(COALESCE(balance, 0) * 100) AS INTEGER)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS balance_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            ref_id INTEGER,
+            created_ts INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    # Reconciliation: one user's entries after a checkpoint, summed from the index alone
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_ledger_user ON balance_ledger(user_id, id, amount_cents)'
+    )
+    # A sale or withdrawal moves a balance once
+    cursor.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_ledger_ref ON balance_ledger(kind, ref_id) WHERE ref_id IS NOT NULL'
+    )
+
+    # Ledger sum per user up to an entry id, as last reconciled
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+            user_id INTEGER PRIMARY KEY,
+            through_id INTEGER NOT NULL,
+            balance_cents INTEGER NOT NULL
+        )
+    ''')
+
+    # Balances from before the ledger become opening entries, so sums match from day one
+    cursor.execute(
+        '''INSERT INTO balance_ledger (user_id, amount_cents, kind, created_ts)
+           SELECT id, balance_cents, 'opening', CAST(strftime('%s', 'now') AS INTEGER)
+           FROM users WHERE balance_cents != 0'''
+    )
+
+
+def _011_outbox_claims(cursor):
+    """Owner and time of each outbox send, so only expired claims are taken back"""
+    _add_column_if_missing(cursor, 'outbox', 'claimed_by', 'TEXT')
+    _add_column_if_missing(cursor, 'outbox', 'claimed_ts', 'REAL')
+
+
+def _012_listing_claims(cursor):
+    """Owner and time of each checker claim, so only expired claims are requeued"""
+    _add_column_if_missing(cursor, 'listings', 'claimed_by', 'TEXT')
+    _add_column_if_missing(cursor, 'listings', 'claimed_ts', 'REAL')
+
+
+def _013_status_batch_index(cursor):
+    """Covering index for the /status/batch ETag probe (no table rows, no check_log reads)"""
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_listings_user_updated ON listings(user_id, id, updated_ts)'
+    )
+
+
+def _014_listing_version(cursor):
+    """Per-listing change counter for the /status/batch ETag (updated_ts repeats within a millisecond)"""
+    _add_column_if_missing(cursor, 'listings', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+    # Same columns as _007's trigger, now also counting every change
+    now_ms = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+    cursor.execute('DROP TRIGGER IF EXISTS trg_listings_touch_update')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_listings_touch_update
+        AFTER UPDATE OF status, check_reason, check_log, receiver_session ON listings
+        BEGIN
+            UPDATE listings SET updated_ts = {now_ms}, version = version + 1 WHERE id = NEW.id;
+        END
+    ''')
+
+    # The ETag probe now reads version instead of updated_ts
+    cursor.execute('DROP INDEX IF EXISTS idx_listings_user_updated')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_listings_user_version ON listings(user_id, id, version)'
+    )
+
+
+# Ordered (version, migration) pairs. Never edit a released migration;
+# append a new one instead.
+MIGRATIONS = [
+    (1, _001_base_schema),
+    (2, _002_hot_path_indexes),
+    (3, _003_profile_status_index),
+    (4, _004_revoked_sessions),
+    (5, _005_campaign_slots_index),
+    (6, _006_fair_scheduler),
+    (7, _007_listing_updated_ts),
+    (8, _008_outbox),
+    (9, _009_withdrawal_messages),
+    (10, _010_balance_ledger),
+    (11, _011_outbox_claims),
+    (12, _012_listing_claims),
+    (13, _013_status_batch_index),
+    (14, _014_listing_version),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn) -> int:
+    """Read the schema version stored in the database header"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target_version: Optional[int] = None) -> int:
+    """
+    Apply missing migrations in order, all in one transaction
+    Returns the schema version after migrating
+    """
+    target = SCHEMA_VERSION if target_version is None else target_version
+
+    # Fast path: a single PRAGMA read when the schema is current
+    current = get_schema_version(conn)
+    if current >= target:
+        return current
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Re-read under the write lock, another worker may have migrated already
+        current = get_schema_version(conn)
+        cursor = conn.cursor()
+        for version, migration in MIGRATIONS:
+            if current < version <= target:
+                migration(cursor)
+                print(f"Applied migration {version}: {migration.__doc__}")
+        if current < target:
+            cursor.execute(f'PRAGMA user_version = {int(target)}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return get_schema_version(conn)
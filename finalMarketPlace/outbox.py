@@ -0,0 +1,158 @@
+"""
+Transactional outbox for outbound Telegram posts
+
+Routes record a post in the same transaction as the change it announces;
+the dispatcher task sends it later, with per-session rate limits and
+retries with backoff. Nothing is dropped: failed posts are retried, at
+most OUTBOX_BACKOFF_MAX apart, until they go through.
+"""
+import json
+import time
+import asyncio
+from typing import Optional
+
+from config import (
+    OUTBOX_BATCH, OUTBOX_POLL_SECONDS, OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX, OUTBOX_SEND_LEASE, WORKER_ID
+)
+from database import run_transaction, fetch_all, execute
+from admission import take_token
+from telegram_handler import (
+    get_withdrawal_sessions, post_withdrawal_request, post_withdrawal_paid, send_purchase_message, post_to_channel
+)
+
+# Set after an enqueue commits so new posts do not wait for the next poll
+_wakeup = asyncio.Event()
+
+
+def enqueue(cursor, kind: str, idempotency_key: str, payload: dict, session_id: Optional[int] = None) -> bool:
+    """
+    Record a post inside the caller's transaction
+    session_id: sending session, None to use the configured withdrawal session at send time
+    Returns False when a post with this key was already recorded
+    """
+    now = time.time()
+    cursor.execute(
+        '''INSERT OR IGNORE INTO outbox (kind, idempotency_key, payload, session_id, next_attempt_ts, created_ts)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (kind, idempotency_key, json.dumps(payload), session_id, now, int(now))
+    )
+    return cursor.rowcount == 1
+
+
+def wake():
+    """Have the dispatcher look at the outbox now (call once the transaction has committed)"""
+    _wakeup.set()
+
+
+def release_stale_sends(cursor) -> int:
+    """
+    Posts whose send was claimed more than OUTBOX_SEND_LEASE ago go back to
+    pending (their worker died); sends other live workers hold are left alone
+    """
+    cursor.execute(
+        "UPDATE outbox SET status = 'pending', claimed_by = NULL WHERE status = 'sending' AND claimed_ts < ?",
+        (time.time() - OUTBOX_SEND_LEASE,)
+    )
+    return cursor.rowcount
+
+
+async def _resolve_session(kind: str, session_id: Optional[int]) -> Optional[int]:
+    if session_id is not None:
+        return session_id
+    sessions = await get_withdrawal_sessions()
+    return sessions['request' if kind == 'withdrawal_request' else 'paid']
+
+
+async def _send(kind: str, session_id: int, payload: dict) -> Optional[str]:
+    """Deliver one post; returns the error, None on success"""
+    if kind == 'withdrawal_request':
+        ok, msg_id, error = await post_withdrawal_request(session_id, payload)
+        if ok:
+            await execute(
+                'UPDATE withdrawals SET withdrawal_request_msg_id = ? WHERE id = ?',
+                (msg_id, payload['id'])
+            )
+    elif kind == 'withdrawal_paid':
+        ok, error = await post_withdrawal_paid(session_id, payload)
+    elif kind == 'withdrawal_paid_digest':
+        ok, _, error = await post_to_channel(session_id, payload['text'])
+    elif kind == 'purchase_message':
+        ok, error = await send_purchase_message(
+            session_id, payload['group_link'], payload['year'],
+            payload['seller_username'], payload['price'], payload['date']
+        )
+    else:
+        return f"Unknown outbox kind: {kind}"
+    return None if ok else error
+
+
+async def dispatch_due() -> int:
+    """One pass over the posts that are due; returns how many were taken"""
+    released = await run_transaction(release_stale_sends)
+    if released:
+        print(f"Outbox: retrying {released} post(s) whose send lease expired")
+    
+    rows = await fetch_all(
+        '''SELECT id, kind, idempotency_key, payload, session_id, attempts FROM outbox
+           WHERE status = 'pending' AND next_attempt_ts <= ?
+           ORDER BY next_attempt_ts, id LIMIT ?''',
+        (time.time(), OUTBOX_BATCH)
+    )
+    
+    for outbox_id, kind, key, payload, session_id, attempts in rows:
+        session = await _resolve_session(kind, session_id)
+        if session is None:
+            error = "No ready session to send from"
+        else:
+            wait = take_token(session, 'telegram_post')
+            if wait:
+                # Not a failure: send once the session's bucket has refilled
+                await execute('UPDATE outbox SET next_attempt_ts = ? WHERE id = ?', (time.time() + wait, outbox_id))
+                continue
+            
+            # Another worker process may have taken it meanwhile
+            claimed = await execute(
+                "UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_ts = ? WHERE id = ? AND status = 'pending'",
+                (WORKER_ID, time.time(), outbox_id)
+            )
+            if claimed != 1:
+                continue
+            try:
+                error = await _send(kind, session, json.loads(payload))
+            except Exception as e:
+                error = str(e)
+        
+        if error is None:
+            await execute(
+                '''UPDATE outbox SET status = 'sent', attempts = attempts + 1, sent_ts = ?, last_error = NULL,
+                       claimed_by = NULL
+                   WHERE id = ?''',
+                (int(time.time()), outbox_id)
+            )
+        else:
+            delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** min(attempts, 20))
+            await execute(
+                '''UPDATE outbox SET status = 'pending', attempts = attempts + 1, next_attempt_ts = ?, last_error = ?,
+                       claimed_by = NULL
+                   WHERE id = ?''',
+                (time.time() + delay, error[:500], outbox_id)
+            )
+            print(f"Outbox post {key} failed (attempt {attempts + 1}), retrying in {delay}s: {error}")
+    
+    return len(rows)
+
+
+async def outbox_dispatcher():
+    """Background task: send due posts, then sleep until woken or the next poll"""
+    while True:
+        _wakeup.clear()
+        try:
+            if await dispatch_due() == OUTBOX_BATCH:
+                continue  # more are probably due
+        except Exception as e:
+            print(f"Outbox dispatcher error: {e}")
+        
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,82 @@
+"""
+Password hashing with scrypt, run on a small bounded thread pool
+"""
+import hmac
+import asyncio
+import hashlib
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from config import (
+    SCRYPT_N, SCRYPT_R, SCRYPT_P, PASSWORD_HASH_WORKERS, PASSWORD_MAX_PENDING
+)
+
+# Separate from the database executor so a burst of logins never queues
+# behind (or in front of) the checker worker's queries
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='pwhash')
+_pending = 0
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Too many hash/verify jobs already queued; the caller should retry later"""
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password as scrypt$n$r$p$salt$hash (blocking, ~50 ms)"""
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+    """
+    Check a password against a stored hash (blocking)
+    Returns: (matches, needs_rehash)
+    """
+    if not stored:
+        # Unknown user: burn the same time as a real check
+        hash_password(password)
+        return False, False
+
+    # Legacy unsalted SHA-256 hex digest
+    if not stored.startswith('scrypt$'):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored), True
+
+    try:
+        _, n, r, p, salt, digest = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+        computed = _scrypt(password, bytes.fromhex(salt), n, r, p)
+    except ValueError:
+        return False, False
+
+    matches = hmac.compare_digest(computed.hex(), digest)
+    return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+async def _run_bounded(func, *args):
+    """Run a hashing job on the pool, refusing work beyond PASSWORD_MAX_PENDING"""
+    global _pending
+    if _pending >= PASSWORD_MAX_PENDING:
+        raise PasswordHasherBusy()
+
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password without blocking the event loop"""
+    return await _run_bounded(hash_password, password)
+
+
+async def verify_password_async(password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+    """verify_password without blocking the event loop"""
+    return await _run_bounded(verify_password, password, stored)
@@ -1,9 +1,9 @@
-"""
-Routes package
-"""
-from .user_routes import router as user_router
-from .listing_routes import router as listing_router
-from .admin_routes import router as admin_router
-from .telegram_routes import router as telegram_router
-
+"""
+Routes package
+"""
+from .user_routes import router as user_router
+from .listing_routes import router as listing_router
+from .admin_routes import router as admin_router
+from .telegram_routes import router as telegram_router
+
 __all__ = ['user_router', 'listing_router', 'admin_router', 'telegram_router']
\ No newline at end of file
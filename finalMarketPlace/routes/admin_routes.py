@@ -1,204 +1,344 @@
-"""
-Admin routes: dashboard, campaigns, sessions, withdrawals
-"""
-import time
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-
-from auth import get_current_user, admin_required
-from database import get_connection
-from config import MAX_GROUPS_PER_RECEIVER
-from templates.template_loader import load_template
-
-router = APIRouter()
-
-
-@router.get('/admin', response_class=HTMLResponse)
-@admin_required
-async def admin_dashboard(request: Request):
-    """Admin dashboard"""
-    user = get_current_user(request)
-    
-    # Get the token from query params
-    token = request.query_params.get('token', '')
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get campaigns
-    cursor.execute(
-    'SELECT id, title, year, month, price_usd, target_count, sold_count FROM campaigns ORDER BY id DESC'
-    )
-    campaigns = []
-    for row in cursor.fetchall():
-        target_count = row[5]
-        sold_count = row[6]
-        progress = int((sold_count / target_count) * 100) if target_count > 0 else 0
-        campaigns.append({
-            'id': row[0],
-            'title': row[1],
-            'year': row[2],
-            'month': row[3],
-            'price_usd': row[4],
-            'target_count': target_count,
-            'sold_count': sold_count,
-            'progress': progress
-        })
-
-    
-    # Get Telegram accounts/sessions
-    cursor.execute(
-        'SELECT id, username, session_type, status, groups_received, last_used_ts FROM admin_sessions ORDER BY session_type, id'
-    )
-    accounts = []
-    for row in cursor.fetchall():
-        accounts.append({
-            'id': row[0],
-            'username': row[1],
-            'session_type': row[2],
-            'status': row[3],
-            'groups_received': row[4],
-            'last_used': time.strftime('%Y-%m-%d %H:%M', time.localtime(row[5])) if row[5] else 'Never'
-        })
-    
-    # Get pending withdrawals
-    cursor.execute(
-        'SELECT id, seller_usdt, amount_usdt FROM withdrawals WHERE status="pending"'
-    )
-    withdrawals = []
-    for row in cursor.fetchall():
-        withdrawals.append({
-            'id': row[0],
-            'seller_usdt': row[1],
-            'amount_usdt': row[2]
-        })
-    
-    conn.close()
-    
-    return load_template('admin.html', {
-        'user': user,
-        'campaigns': campaigns,
-        'accounts': accounts,
-        'withdrawals': withdrawals,
-        'max_groups': MAX_GROUPS_PER_RECEIVER,
-        'token': token  # ADD THIS LINE - pass token to template
-    })
-
-
-@router.post('/admin/campaign')
-@admin_required
-async def create_campaign(
-    request: Request,
-    title: str = Form(...),
-    year: int = Form(...),
-    month: int = Form(None),  # ADD THIS: month can be None
-    price_usd: float = Form(...),
-    target: int = Form(...),
-    token: str = Form(None)
-):
-    """Create new campaign with optional month"""
-    # Convert empty month to None
-    if month == "" or month is None:
-        month_value = None
-    else:
-        month_value = int(month)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO campaigns (title, year, month, price_usd, target_count, created_ts) VALUES (?, ?, ?, ?, ?, ?)',
-        (title, year, month_value, price_usd, target, int(time.time()))
-    )
-    conn.commit()
-    conn.close()
-    
-    return RedirectResponse(f'/admin?token={token}' if token else '/admin', status_code=303)
-
-
-@router.post('/admin/del_campaign/{campaign_id}')
-@admin_required
-async def delete_campaign(request: Request, campaign_id: int):
-    """Delete campaign"""
-    # GET TOKEN FROM QUERY PARAMS
-    token = request.query_params.get('token', '')
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM campaigns WHERE id=?', (campaign_id,))
-    conn.commit()
-    conn.close()
-    
-    # ADD TOKEN TO REDIRECT
-    return RedirectResponse(f'/admin?token={token}' if token else '/admin', status_code=303)
-
-
-@router.post('/admin/pay/{withdrawal_id}')
-@admin_required
-async def mark_paid(request: Request, withdrawal_id: int, txid: str = Form(...)):
-    """Mark withdrawal as paid and post to public channel"""
-    token = request.query_params.get('token', '')
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Get withdrawal details
-        cursor.execute(
-            '''SELECT w.user_id, w.amount_usdt, w.status, u.username
-               FROM withdrawals w
-               JOIN users u ON w.user_id = u.id
-               WHERE w.id = ?''',
-            (withdrawal_id,)
-        )
-        row = cursor.fetchone()
-        
-        if not row:
-            conn.close()
-            return RedirectResponse(f'/admin?token={token}&error=Withdrawal+not+found', status_code=303)
-        
-        user_id, amount, current_status, username = row
-        
-        if current_status == 'paid':
-            conn.close()
-            return RedirectResponse(f'/admin?token={token}&error=Withdrawal+already+paid', status_code=303)
-        
-        # Update withdrawal status
-        cursor.execute(
-            'UPDATE withdrawals SET status="paid", txid=?, paid_ts=? WHERE id=?',
-            (txid, int(time.time()), withdrawal_id)
-        )
-        
-        conn.commit()
-        
-        # Post to public payment channel
-        from telegram_handler import get_withdrawal_sessions, post_withdrawal_paid
-        from datetime import datetime
-        from config import USDT_NETWORK
-        
-        withdrawal_sessions = await get_withdrawal_sessions()
-        
-        if withdrawal_sessions['paid']:
-            payment_data = {
-                'username': username,
-                'amount': amount,
-                'txid': txid,
-                'network': USDT_NETWORK,
-                'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-            }
-            
-            success, error = await post_withdrawal_paid(
-                withdrawal_sessions['paid'],
-                payment_data
-            )
-            
-            if not success:
-                print(f"Failed to post payment: {error}")
-        
-        conn.close()
-        
-        return RedirectResponse(f'/admin?token={token}&success=Withdrawal+marked+as+paid', status_code=303)
-        
-    except Exception as e:
-        conn.rollback()
-        conn.close()
-        return RedirectResponse(f'/admin?token={token}&error=Failed+to+mark+paid:+{str(e)}', status_code=303)
\ No newline at end of file
+"""
+Admin routes: dashboard, campaigns, sessions, withdrawals
+"""
+import csv
+import json
+import time
+import hashlib
+from datetime import datetime
+from fastapi import APIRouter, Request, Form
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from starlette.datastructures import UploadFile
+
+from auth import get_current_user, admin_required
+from database import run_transaction, run_immediate, execute
+from config import MAX_GROUPS_PER_RECEIVER, USDT_NETWORK, TELEGRAM_MESSAGE_LIMIT, PAYOUT_BATCH_MAX
+from campaign_cache import get_campaigns, invalidate_campaigns
+from scheduler import set_campaign_priority
+from outbox import enqueue, wake as wake_outbox
+from telegram_handler import chunk_lines, mask_username, telegram_length
+from templates.template_loader import stream_template
+
+router = APIRouter()
+
+
+def _load_dashboard(cursor):
+    """Telegram accounts and pending withdrawals for the dashboard"""
+    # Get Telegram accounts/sessions
+    cursor.execute(
+        'SELECT id, username, session_type, status, groups_received, last_used_ts FROM admin_sessions ORDER BY session_type, id'
+    )
+    accounts = []
+    for row in cursor.fetchall():
+        accounts.append({
+            'id': row[0],
+            'username': row[1],
+            'session_type': row[2],
+            'status': row[3],
+            'groups_received': row[4],
+            'last_used': time.strftime('%Y-%m-%d %H:%M', time.localtime(row[5])) if row[5] else 'Never'
+        })
+    
+    # Get pending withdrawals
+    cursor.execute(
+        'SELECT id, seller_usdt, amount_usdt FROM withdrawals WHERE status="pending"'
+    )
+    withdrawals = []
+    for row in cursor.fetchall():
+        withdrawals.append({
+            'id': row[0],
+            'seller_usdt': row[1],
+            'amount_usdt': row[2]
+        })
+    
+    return accounts, withdrawals
+
+
+@router.get('/admin', response_class=HTMLResponse)
+@admin_required
+async def admin_dashboard(request: Request):
+    """Admin dashboard"""
+    user = await get_current_user(request)
+    
+    # Get the token from query params
+    token = request.query_params.get('token', '')
+    
+    campaigns = await get_campaigns()
+    accounts, withdrawals = await run_transaction(_load_dashboard)
+    
+    return stream_template('admin.html', {
+        'user': user,
+        'campaigns': campaigns,
+        'accounts': accounts,
+        'withdrawals': withdrawals,
+        'max_groups': MAX_GROUPS_PER_RECEIVER,
+        'token': token  # ADD THIS LINE - pass token to template
+    })
+
+
+@router.post('/admin/campaign')
+@admin_required
+async def create_campaign(
+    request: Request,
+    title: str = Form(...),
+    year: int = Form(...),
+    month: int = Form(None),  # ADD THIS: month can be None
+    price_usd: float = Form(...),
+    target: int = Form(...),
+    token: str = Form(None)
+):
+    """Create new campaign with optional month"""
+    # Convert empty month to None
+    if month == "" or month is None:
+        month_value = None
+    else:
+        month_value = int(month)
+    
+    await execute(
+        'INSERT INTO campaigns (title, year, month, price_usd, target_count, created_ts) VALUES (?, ?, ?, ?, ?, ?)',
+        (title, year, month_value, price_usd, target, int(time.time()))
+    )
+    invalidate_campaigns()
+    
+    return RedirectResponse(f'/admin?token={token}' if token else '/admin', status_code=303)
+
+
+@router.post('/admin/del_campaign/{campaign_id}')
+@admin_required
+async def delete_campaign(request: Request, campaign_id: int):
+    """Delete campaign"""
+    # GET TOKEN FROM QUERY PARAMS
+    token = request.query_params.get('token', '')
+    
+    await execute('DELETE FROM campaigns WHERE id=?', (campaign_id,))
+    invalidate_campaigns()
+    
+    # ADD TOKEN TO REDIRECT
+    return RedirectResponse(f'/admin?token={token}' if token else '/admin', status_code=303)
+
+
+@router.post('/admin/campaign/{campaign_id}/priority')
+@admin_required
+async def update_campaign_priority(
+    request: Request,
+    campaign_id: int,
+    priority: int = Form(1),
+    expedite: str = Form(None),
+    token: str = Form(None)
+):
+    """Set a campaign's scheduling weight and expedite flag"""
+    priority = max(1, min(priority, 100))
+    await run_transaction(set_campaign_priority, campaign_id, priority, bool(expedite))
+    invalidate_campaigns()
+    
+    return RedirectResponse(f'/admin?token={token}' if token else '/admin', status_code=303)
+
+
+def _mark_paid(cursor, withdrawal_id, txid):
+    """
+    Mark a withdrawal paid and queue the public payment post, once
+    Run under run_immediate: the status check and the update must not interleave
+    Returns: error message, or None on success
+    """
+    cursor.execute(
+        '''SELECT w.amount_usdt, w.status, u.username
+           FROM withdrawals w
+           JOIN users u ON w.user_id = u.id
+           WHERE w.id = ?''',
+        (withdrawal_id,)
+    )
+    row = cursor.fetchone()
+    
+    if not row:
+        return 'Withdrawal not found'
+    
+    amount, current_status, username = row
+    
+    if current_status == 'paid':
+        return 'Withdrawal already paid'
+    
+    # Update withdrawal status (guarded like _pay_batch: never overwrite a recorded txid)
+    cursor.execute(
+        'UPDATE withdrawals SET status="paid", txid=?, paid_ts=? WHERE id=? AND status="pending"',
+        (txid, int(time.time()), withdrawal_id)
+    )
+    if cursor.rowcount == 0:
+        return 'Withdrawal already paid'
+    
+    # Post to public payment channel (sent by the outbox dispatcher)
+    enqueue(cursor, 'withdrawal_paid', f'withdrawal_paid:{withdrawal_id}', {
+        'username': username,
+        'amount': amount,
+        'txid': txid,
+        'network': USDT_NETWORK,
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M')
+    })
+    return None
+
+
+@router.post('/admin/pay/{withdrawal_id}')
+@admin_required
+async def mark_paid(request: Request, withdrawal_id: int, txid: str = Form(...)):
+    """Mark withdrawal as paid and post to public channel"""
+    token = request.query_params.get('token', '')
+    
+    try:
+        error = await run_immediate(_mark_paid, withdrawal_id, txid)
+        
+        if error:
+            return RedirectResponse(f'/admin?token={token}&error={error.replace(" ", "+")}', status_code=303)
+        
+        wake_outbox()
+        return RedirectResponse(f'/admin?token={token}&success=Withdrawal+marked+as+paid', status_code=303)
+        
+    except Exception as e:
+        return RedirectResponse(f'/admin?token={token}&error=Failed+to+mark+paid:+{str(e)}', status_code=303)
+
+
+def _parse_payouts(text: str):
+    """
+    Withdrawal id -> txid pairs from JSON ({"12": "0x..."} or [{"id": 12, "txid": "0x..."}])
+    or CSV (id,txid per line, optional header)
+    Returns: (payouts, errors)
+    """
+    text = text.strip()
+    pairs = []
+    if text.startswith(('{', '[')):
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            return [], [f"Invalid JSON: {e}"]
+        if isinstance(data, dict):
+            pairs = [(str(k), v) for k, v in data.items()]
+        else:
+            pairs = [(str(item.get('id', '')), item.get('txid')) if isinstance(item, dict) else ('', None) for item in data]
+        sources = [f"Entry {i}" for i in range(1, len(pairs) + 1)]
+    else:
+        rows = [row for row in csv.reader(text.splitlines()) if row and any(cell.strip() for cell in row)]
+        if rows and not rows[0][0].strip().lstrip('#').isdigit():
+            rows = rows[1:]  # header
+        pairs = [(row[0], row[1] if len(row) > 1 else None) for row in rows]
+        sources = [f"Row {i}" for i in range(1, len(pairs) + 1)]
+    
+    payouts = []
+    errors = []
+    seen = set()
+    for source, (raw_id, txid) in zip(sources, pairs):
+        raw_id = raw_id.strip().lstrip('#')
+        txid = txid.strip() if isinstance(txid, str) else ''
+        if not raw_id.isdigit():
+            errors.append(f"{source}: invalid withdrawal id")
+        elif not txid:
+            errors.append(f"{source}: missing txid")
+        elif int(raw_id) in seen:
+            errors.append(f"{source}: withdrawal #{raw_id} listed twice")
+        else:
+            seen.add(int(raw_id))
+            payouts.append((int(raw_id), txid))
+    return payouts, errors
+
+
+def _digest_posts(payments: list, date: str) -> list:
+    """Public digest of a payout batch, split into messages within Telegram's size limit"""
+    total = sum(p['amount'] for p in payments)
+    
+    def header(part, parts):
+        return (
+            f"✅ **Payouts Completed** ({part}/{parts}) ✅\n"
+            f"📅 {date} · {len(payments)} payments · ${total:.2f} USDT ({USDT_NETWORK})\n\n"
+        )
+    
+    lines = (
+        f"👤 @{mask_username(p['username'])} · 💵 ${p['amount']} · 🔗 `{p['txid']}`"
+        for p in payments
+    )
+    # Room for the widest header: there are never more parts than payments
+    room = TELEGRAM_MESSAGE_LIMIT - telegram_length(header(len(payments), len(payments)))
+    bodies = list(chunk_lines(lines, room))
+    return [header(i, len(bodies)) + body for i, body in enumerate(bodies, 1)]
+
+
+def _pay_batch(cursor, payouts):
+    """
+    Mark every withdrawal in the batch paid, or none of them, and queue the digest posts
+    Returns: (summary, errors)
+    """
+    found = {}
+    ids = [withdrawal_id for withdrawal_id, _ in payouts]
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        cursor.execute(
+            f'''SELECT w.id, w.amount_usdt, w.status, u.username
+                FROM withdrawals w
+                JOIN users u ON w.user_id = u.id
+                WHERE w.id IN ({', '.join('?' * len(part))})''',
+            part
+        )
+        found.update({row[0]: row[1:] for row in cursor.fetchall()})
+    
+    errors = []
+    for withdrawal_id in ids:
+        if withdrawal_id not in found:
+            errors.append(f"Withdrawal #{withdrawal_id} not found")
+        elif found[withdrawal_id][1] != 'pending':
+            errors.append(f"Withdrawal #{withdrawal_id} is {found[withdrawal_id][1]}")
+    if errors:
+        return None, errors
+    
+    now = int(time.time())
+    cursor.executemany(
+        'UPDATE withdrawals SET status="paid", txid=?, paid_ts=? WHERE id=? AND status="pending"',
+        [(txid, now, withdrawal_id) for withdrawal_id, txid in payouts]
+    )
+    
+    payments = [
+        {'username': found[withdrawal_id][2], 'amount': found[withdrawal_id][0], 'txid': txid}
+        for withdrawal_id, txid in payouts
+    ]
+    posts = _digest_posts(payments, datetime.now().strftime('%Y-%m-%d %H:%M'))
+    
+    # One outbox post per message, so a failed part is retried alone
+    batch_key = hashlib.sha256(','.join(map(str, sorted(ids))).encode()).hexdigest()[:16]
+    for part, text in enumerate(posts, 1):
+        enqueue(cursor, 'withdrawal_paid_digest', f'withdrawal_paid_digest:{batch_key}:{part}', {'text': text})
+    
+    return {
+        'paid': len(payments),
+        'total': round(sum(p['amount'] for p in payments), 2),
+        'posts': len(posts)
+    }, []
+
+
+@router.post('/admin/payouts/batch')
+@admin_required
+async def pay_batch(request: Request):
+    """Mark many withdrawals paid from a CSV or JSON of withdrawal id -> txid, with digest channel posts"""
+    if request.headers.get('content-type', '').startswith('application/json'):
+        text = (await request.body()).decode('utf-8', errors='replace')
+    else:
+        form = await request.form()
+        upload = form.get('file')
+        if isinstance(upload, UploadFile) and upload.filename:
+            text = (await upload.read()).decode('utf-8-sig', errors='replace')
+        else:
+            text = form.get('payouts') or ''
+    
+    payouts, errors = _parse_payouts(text)
+    if not errors and not payouts:
+        errors = ['No payouts given']
+    if len(payouts) > PAYOUT_BATCH_MAX:
+        errors.append(f"At most {PAYOUT_BATCH_MAX} payouts per batch")
+    
+    if not errors:
+        summary, errors = await run_immediate(_pay_batch, payouts)
+    
+    if errors:
+        # Nothing was marked paid
+        return JSONResponse({
+            'status': 'error',
+            'message': f"{len(errors)} problem(s), no withdrawal was marked paid",
+            'errors': errors[:100]
+        })
+    
+    wake_outbox()
+    return JSONResponse({'status': 'success', **summary})
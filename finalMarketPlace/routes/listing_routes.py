@@ -1,248 +1,598 @@
-"""
-Listing-related routes: sell, status check, transfer
-"""
-import time
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
-from jinja2 import Template
-
-from auth import get_current_user, login_required
-from database import get_connection
-from telegram_handler import verify_receiver_ownership
-from config import active_telegram_clients
-from templates.template_loader import load_template
-
-router = APIRouter()
-
-
-@router.get('/sell', response_class=HTMLResponse)
-@login_required
-async def sell_form(request: Request, cid: int = None):
-    """Group selling form"""
-    user = get_current_user(request)
-    
-    campaign = None
-    if cid:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, title, year, month, price_usd FROM campaigns WHERE id=?', (cid,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            campaign = {
-                'id': row[0],
-                'title': row[1],
-                'year': row[2],
-                'month': row[3],  # ADD THIS
-                'price_usd': row[4]
-            }
-    
-    return load_template('sell.html', {'user': user, 'campaign': campaign})
-
-
-@router.post('/sell')
-@login_required
-async def create_listing(request: Request):
-    """Submit groups for verification - return JSON for AJAX handling"""
-    form = await request.form()
-    campaign_id = form.get('cid')
-    group_links = form.getlist('group_link[]')
-    
-    if not campaign_id:
-        return JSONResponse({
-            'status': 'error',
-            'message': 'No campaign selected'
-        })
-    
-    if not group_links:
-        return JSONResponse({
-            'status': 'error',
-            'message': 'No groups provided'
-        })
-    
-    try:
-        campaign_id = int(campaign_id)
-    except:
-        return JSONResponse({
-            'status': 'error',
-            'message': 'Invalid campaign ID'
-        })
-    
-    user = get_current_user(request)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Verify campaign exists
-    cursor.execute('SELECT price_usd FROM campaigns WHERE id=?', (campaign_id,))
-    row = cursor.fetchone()
-    
-    if not row:
-        conn.close()
-        return JSONResponse({
-            'status': 'error',
-            'message': 'Invalid campaign'
-        })
-    
-    price = row[0]
-    count = 0
-    
-    # Create listings
-    for link in group_links:
-        link = link.strip()
-        if link:
-            cursor.execute(
-                '''INSERT INTO listings 
-                   (user_id, campaign_id, group_link, seller_tg, seller_usdt, price_usd, status, created_ts) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                (user['id'], campaign_id, link, user['telegram_username'], 
-                 user['usdt_wallet'], price, 'pending', int(time.time()))
-            )
-            count += 1
-    
-    conn.commit()
-    conn.close()
-    
-    return JSONResponse({
-        'status': 'success',
-        'count': count,
-        'message': f'{count} group(s) submitted for checking'
-    })
-
-
-@router.get('/status/{listing_id}')
-@login_required
-async def check_status(request: Request, listing_id: int):
-    """Get listing status"""
-    user = get_current_user(request)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT status, check_reason, check_log, user_id, receiver_session FROM listings WHERE id=?',
-        (listing_id,)
-    )
-    row = cursor.fetchone()
-    
-    if not row or row[3] != user['id']:
-        conn.close()
-        return JSONResponse({
-            'status': 'error',
-            'message': 'Not found'
-        })
-    
-    target_username = None
-    if row[0] == 'ready_for_transfer' and row[4]:
-        cursor.execute('SELECT username FROM admin_sessions WHERE id=?', (row[4],))
-        session_row = cursor.fetchone()
-        if session_row:
-            target_username = session_row[0]
-    
-    conn.close()
-    
-    return JSONResponse({
-        'status': row[0],
-        'reason': row[1],
-        'log': row[2],
-        'target_username': target_username
-    })
-
-
-@router.post('/transfer/{listing_id}')
-@login_required
-async def confirm_transfer(request: Request, listing_id: int):
-    """Confirm ownership transfer and send purchase message"""
-    user = get_current_user(request)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''SELECT l.user_id, l.receiver_session, l.group_link, l.campaign_id, l.price_usd, l.status, c.year
-           FROM listings l
-           JOIN campaigns c ON l.campaign_id = c.id
-           WHERE l.id=?''',
-        (listing_id,)
-    )
-    row = cursor.fetchone()
-    
-    if not row or row[0] != user['id']:
-        conn.close()
-        return JSONResponse({
-            'status': 'error',
-            'message': 'Not found'
-        })
-    
-    if row[5] != 'ready_for_transfer':
-        conn.close()
-        return JSONResponse({
-            'status': 'error',
-            'message': 'Listing not ready for transfer'
-        })
-    
-    receiver_session_id = row[1]
-    group_link = row[2]
-    campaign_year = row[6]
-    
-    if not receiver_session_id or receiver_session_id not in active_telegram_clients:
-        conn.close()
-        return JSONResponse({
-            'status': 'error',
-            'message': 'Receiver session offline'
-        })
-    
-    # Verify ownership
-    verified, message = await verify_receiver_ownership(receiver_session_id, group_link)
-    
-    if not verified:
-        conn.close()
-        return JSONResponse({
-            'status': 'error',
-            'message': message
-        })
-    
-    # Send purchase message in the group
-    from telegram_handler import send_purchase_message
-    
-    msg_sent, msg_status = await send_purchase_message(
-        receiver_session_id,
-        group_link,
-        campaign_year,
-        user['telegram_username'],
-        row[4]
-    )
-    
-    # Process successful transfer
-    now = int(time.time())
-    
-    cursor.execute(
-        'UPDATE listings SET status="sold", transferred_ts=? WHERE id=?',
-        (now, listing_id)
-    )
-    
-    # Update user balance
-    cursor.execute(
-        'UPDATE users SET balance = balance + ? WHERE id=?',
-        (row[4], user['id'])
-    )
-    
-    # Update campaign sold count
-    cursor.execute(
-        'UPDATE campaigns SET sold_count = sold_count + 1 WHERE id=?',
-        (row[3],)
-    )
-    
-    # Update receiver session group count
-    cursor.execute(
-        'UPDATE admin_sessions SET groups_received = groups_received + 1 WHERE id=?',
-        (receiver_session_id,)
-    )
-    
-    conn.commit()
-    conn.close()
-    
-    return JSONResponse({
-        'status': 'success',
-        'amount': row[4],
-        'message_sent': msg_sent
-    })
\ No newline at end of file
+"""
+Listing-related routes: sell, status check, transfer
+"""
+import csv
+import json
+import time
+from datetime import datetime
+from fastapi import APIRouter, Request, Form
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
+from starlette.datastructures import UploadFile
+from jinja2 import Template
+
+from auth import get_current_user, get_session, login_required, invalidate_user
+from database import run_transaction, run_immediate, fetch_one, fetch_all
+from telegram_handler import verify_receiver_ownership
+from config import (
+    active_telegram_clients, IMPORT_MAX_LINES, IMPORT_CHUNK_SIZE, IMPORT_READ_SIZE, SSE_HEARTBEAT_SECONDS,
+    STATUS_BATCH_MAX
+)
+from links import parse_link
+from campaign_slots import open_slots
+from scheduler import next_vtimes, jobs_ahead
+from throughput import estimate_wait, seconds_per_check
+from admission import take_token, queue_room, queue_retry_after, too_many_requests
+from events import publish_status, at_capacity, stream
+from outbox import enqueue, wake as wake_outbox
+from ledger import post_entry, to_cents
+from locks import single_flight, LockBusy
+from campaign_cache import get_campaign, invalidate_campaigns
+from templates.template_loader import load_template
+
+router = APIRouter()
+
+
+@router.get('/sell', response_class=HTMLResponse)
+@login_required
+async def sell_form(request: Request, cid: int = None):
+    """Group selling form"""
+    user = await get_current_user(request)
+    
+    campaign = None
+    slots = 0
+    if cid:
+        campaign = await get_campaign(cid)
+        if campaign:
+            slots = await run_transaction(open_slots, cid)
+    
+    return await load_template('sell.html', {'user': user, 'campaign': campaign, 'open_slots': slots})
+
+
+def _load_open_links(cursor, user_id):
+    """Canonical links of the seller's listings still queued or awaiting transfer"""
+    cursor.execute(
+        "SELECT group_link FROM listings WHERE user_id=? AND status IN ('pending', 'checking', 'ready_for_transfer')",
+        (user_id,)
+    )
+    open_links = set()
+    for (link,) in cursor.fetchall():
+        open_links.add(parse_link(link).canonical or link)
+    return open_links
+
+
+def _listing_row(user, campaign, link, created_ts):
+    """Parameters for one INSERT INTO listings"""
+    return (user['id'], campaign['id'], link, user['telegram_username'],
+            user['usdt_wallet'], campaign['price_usd'], 'pending', created_ts)
+
+
+def _insert_listings(cursor, campaign, rows):
+    """Queue one seller's prepared listing rows with a single executemany"""
+    vtimes = next_vtimes(cursor, rows[0][0], campaign['priority'], len(rows))
+    cursor.executemany(
+        '''INSERT INTO listings 
+           (user_id, campaign_id, group_link, seller_tg, seller_usdt, price_usd, status, created_ts, vtime, expedite) 
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        [row + (vtime, campaign['expedite']) for row, vtime in zip(rows, vtimes)]
+    )
+
+
+def _insert_within_limits(cursor, campaign, rows):
+    """
+    Insert as many rows as both the campaign's open slots and the queue caps allow
+    Returns: (inserted count, 'campaign_full' or 'queue_full' for the rest)
+    """
+    slots = open_slots(cursor, campaign['id'])
+    room = queue_room(cursor, rows[0][0]) if rows else 0
+    accepted = rows[:max(0, min(slots, room))]
+    if accepted:
+        _insert_listings(cursor, campaign, accepted)
+    return len(accepted), 'queue_full' if room < slots else 'campaign_full'
+
+
+def _queue_links(cursor, user, campaign, group_links):
+    """
+    Canonicalize, de-duplicate and queue links, up to the campaign's open slots and queue caps
+    Returns: (queued count, [skipped link messages])
+    """
+    open_links = _load_open_links(cursor, user['id'])
+    now = int(time.time())
+    rows = []
+    skipped = []
+    
+    for raw in group_links:
+        if not raw.strip():
+            continue
+        parsed = parse_link(raw)
+        if not parsed.ok:
+            skipped.append(f"{raw.strip()}: {parsed.error}")
+        elif parsed.canonical in open_links:
+            skipped.append(f"{raw.strip()}: already submitted")
+        else:
+            open_links.add(parsed.canonical)
+            rows.append(_listing_row(user, campaign, parsed.canonical, now))
+    
+    count, reason = _insert_within_limits(cursor, campaign, rows)
+    message = 'campaign is full' if reason == 'campaign_full' else 'your checking queue is full'
+    skipped.extend(f"{row[2]}: {message}" for row in rows[count:])
+    return count, skipped
+
+
+async def _admit_submission(user_id):
+    """Rate limit and queue-depth check for new submissions: a 429 response, or None to proceed"""
+    retry_after = take_token(user_id, 'sell')
+    if retry_after:
+        return too_many_requests('Too many submissions, please slow down', retry_after)
+    
+    room = await run_transaction(queue_room, user_id)
+    if room <= 0:
+        return too_many_requests('The checking queue is full, please try again later', queue_retry_after(room))
+    return None
+
+
+@router.post('/sell')
+@login_required
+async def create_listing(request: Request):
+    """Submit groups for verification - return JSON for AJAX handling"""
+    rejected = await _admit_submission((await get_session(request))['uid'])
+    if rejected:
+        return rejected
+    
+    form = await request.form()
+    campaign_id = form.get('cid')
+    group_links = form.getlist('group_link[]')
+    
+    if not campaign_id:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No campaign selected'
+        })
+    
+    if not group_links:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No groups provided'
+        })
+    
+    try:
+        campaign_id = int(campaign_id)
+    except:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Invalid campaign ID'
+        })
+    
+    campaign = await get_campaign(campaign_id)
+    if not campaign:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Invalid campaign'
+        })
+    
+    user = await get_current_user(request)
+    
+    count, skipped = await run_immediate(_queue_links, user, campaign, group_links)
+    
+    if not count:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No valid new groups: ' + '; '.join(skipped) if skipped else 'No groups provided',
+            'skipped': skipped
+        })
+    
+    return JSONResponse({
+        'status': 'success',
+        'count': count,
+        'skipped': skipped,
+        'message': f'{count} group(s) submitted for checking'
+    })
+
+
+async def _iter_upload_lines(upload: UploadFile):
+    """Yield decoded lines of an uploaded file without reading it all into memory"""
+    buffer = b''
+    first = True
+    while True:
+        chunk = await upload.read(IMPORT_READ_SIZE)
+        if not chunk:
+            break
+        if first:
+            chunk = chunk.removeprefix(b'\xef\xbb\xbf')  # UTF-8 BOM
+            first = False
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8', 'replace').rstrip('\r')
+    if buffer:
+        yield buffer.decode('utf-8', 'replace').rstrip('\r')
+
+
+def _first_cell(line: str) -> str:
+    """The link column of a CSV row (first non-empty cell), or the line itself"""
+    if ',' not in line and ';' not in line:
+        return line
+    delimiter = ',' if ',' in line else ';'
+    for cell in next(csv.reader([line], delimiter=delimiter)):
+        if cell.strip():
+            return cell
+    return ''
+
+
+async def _import_stream(user, campaign, upload: UploadFile, open_links: set):
+    """Parse, validate and queue an upload, yielding one NDJSON result per line"""
+    counts = {'queued': 0, 'invalid': 0, 'duplicate': 0, 'campaign_full': 0, 'queue_full': 0}
+    rows = []
+    queued = []  # results matching rows, in order
+    results = []
+    line_no = 0
+    full = None  # 'campaign_full' / 'queue_full' once no more rows fit
+    
+    async def flush():
+        nonlocal full
+        # Results for queued links are only reported once their chunk commits
+        if rows:
+            accepted, reason = await run_immediate(_insert_within_limits, campaign, rows)
+            for result in queued[accepted:]:
+                result['status'] = reason
+            counts['queued'] -= len(rows) - accepted
+            counts[reason] += len(rows) - accepted
+            if accepted < len(rows):
+                full = reason
+            rows.clear()
+            queued.clear()
+        lines = ''.join(json.dumps(r) + '\n' for r in results)
+        results.clear()
+        return lines
+    
+    try:
+        async for line in _iter_upload_lines(upload):
+            line_no += 1
+            if line_no > IMPORT_MAX_LINES:
+                results.append({'line': line_no, 'status': 'error', 'reason': f'import limit is {IMPORT_MAX_LINES} lines'})
+                break
+            
+            raw = _first_cell(line).strip()
+            if not raw:
+                continue
+            
+            parsed = parse_link(raw)
+            canonical = parsed.canonical
+            if not parsed.ok:
+                # A CSV header row is not worth reporting
+                if line_no == 1 and 't.me' not in raw.lower() and not raw.startswith('@'):
+                    continue
+                counts['invalid'] += 1
+                results.append({'line': line_no, 'link': raw[:100], 'status': 'invalid', 'reason': parsed.error})
+            elif canonical in open_links:
+                counts['duplicate'] += 1
+                results.append({'line': line_no, 'link': canonical, 'status': 'duplicate'})
+            elif full:
+                # No more room: report the rest of the file without touching the database
+                counts[full] += 1
+                results.append({'line': line_no, 'link': canonical, 'status': full})
+            else:
+                open_links.add(canonical)
+                counts['queued'] += 1
+                rows.append(_listing_row(user, campaign, canonical, int(time.time())))
+                queued.append({'line': line_no, 'link': canonical, 'status': 'queued'})
+                results.append(queued[-1])
+            
+            if len(rows) >= IMPORT_CHUNK_SIZE or len(results) >= IMPORT_CHUNK_SIZE:
+                yield await flush()
+        
+        yield await flush()
+        yield json.dumps({'done': True, 'lines': line_no, **counts}) + '\n'
+    finally:
+        await upload.close()
+    
+    print(f"📥 Import by user {user['id']}: {counts['queued']} queued, "
+          f"{counts['invalid']} invalid, {counts['duplicate']} duplicate, {counts['campaign_full']} over target, {counts['queue_full']} over queue cap")
+
+
+@router.post('/sell/import')
+@login_required
+async def import_listings(request: Request):
+    """Bulk import a text/CSV file of links; streams per-line results as NDJSON"""
+    rejected = await _admit_submission((await get_session(request))['uid'])
+    if rejected:
+        return rejected
+    
+    form = await request.form()
+    upload = form.get('links')
+    
+    if not isinstance(upload, UploadFile):
+        return JSONResponse({
+            'status': 'error',
+            'message': 'No file uploaded'
+        })
+    
+    try:
+        campaign = await get_campaign(int(form.get('cid')))
+    except (TypeError, ValueError):
+        campaign = None
+    
+    if not campaign:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Invalid campaign'
+        })
+    
+    user = await get_current_user(request)
+    open_links = await run_transaction(_load_open_links, user['id'])
+    
+    return StreamingResponse(
+        _import_stream(user, campaign, upload, open_links),
+        media_type='application/x-ndjson'
+    )
+
+
+def _parse_ids(raw: str) -> list:
+    """Comma-separated listing ids, deduplicated and in request order"""
+    return list(dict.fromkeys(int(part) for part in raw.split(',') if part.strip().isdigit()))
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match holds '*' or etag in its comma-separated list (weak comparison)"""
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in tags]
+
+
+# Declared before /status/{listing_id} so 'batch' is not parsed as an id
+@router.get('/status/batch')
+@login_required
+async def check_status_batch(request: Request, ids: str = ''):
+    """Status of many listings in one request (?ids=1,2,3), with ETag / 304 support"""
+    user_id = (await get_session(request))['uid']
+    
+    retry_after = take_token(user_id, 'status')
+    if retry_after:
+        return too_many_requests('Polling too fast', retry_after)
+    
+    listing_ids = _parse_ids(ids)
+    if not listing_ids:
+        return JSONResponse({'status': 'error', 'message': 'No listing ids given'})
+    if len(listing_ids) > STATUS_BATCH_MAX:
+        return JSONResponse({'status': 'error', 'message': f'At most {STATUS_BATCH_MAX} ids per request'})
+    
+    placeholders = ', '.join('?' * len(listing_ids))
+    
+    # Every change bumps the row's version (trigger), so the sum only grows while the rows
+    # stay and the count only shrinks: together they never repeat for one set of ids.
+    # idx_listings_user_version answers this without reading rows, so an unchanged poll stays cheap
+    versions, count = await fetch_one(
+        f'SELECT SUM(version), COUNT(*) FROM listings WHERE user_id = ? AND id IN ({placeholders})',
+        (user_id, *listing_ids)
+    )
+    etag = f'W/"{versions or 0}-{count}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if _etag_matches(request.headers.get('if-none-match', ''), etag):
+        return Response(status_code=304, headers=headers)
+    
+    # Receiver username only matters (and is only joined) while the seller has to transfer
+    rows = await fetch_all(
+        f'''SELECT l.id, l.status, l.check_reason, l.check_log, s.username
+            FROM listings l
+            LEFT JOIN admin_sessions s ON s.id = l.receiver_session AND l.status = 'ready_for_transfer'
+            WHERE l.user_id = ? AND l.id IN ({placeholders})''',
+        (user_id, *listing_ids)
+    )
+    
+    return JSONResponse({
+        'status': 'success',
+        'listings': {
+            str(r[0]): {
+                'status': r[1],
+                'reason': r[2],
+                'log': r[3],
+                'target_username': r[4]
+            } for r in rows
+        }
+    }, headers=headers)
+
+
+@router.get('/status/{listing_id}')
+@login_required
+async def check_status(request: Request, listing_id: int):
+    """Get listing status"""
+    # Polled every few seconds: login_required already resolved the user (TTL cache), only its id is used here
+    user_id = (await get_session(request))['uid']
+    
+    retry_after = take_token(user_id, 'status')
+    if retry_after:
+        return too_many_requests('Polling too fast', retry_after)
+    
+    row = await fetch_one(
+        'SELECT status, check_reason, check_log, user_id, receiver_session FROM listings WHERE id=?',
+        (listing_id,)
+    )
+    
+    if not row or row[3] != user_id:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Not found'
+        })
+    
+    target_username = None
+    if row[0] == 'ready_for_transfer' and row[4]:
+        session_row = await fetch_one('SELECT username FROM admin_sessions WHERE id=?', (row[4],))
+        if session_row:
+            target_username = session_row[0]
+    
+    return JSONResponse({
+        'status': row[0],
+        'reason': row[1],
+        'log': row[2],
+        'target_username': target_username
+    })
+
+
+@router.get('/status/{listing_id}/queue')
+@login_required
+async def queue_position(request: Request, listing_id: int):
+    """Queue position and ETA for a pending listing"""
+    user_id = (await get_session(request))['uid']
+    
+    retry_after = take_token(user_id, 'status')
+    if retry_after:
+        return too_many_requests('Polling too fast', retry_after)
+    
+    row = await fetch_one('SELECT status, expedite, vtime, user_id FROM listings WHERE id=?', (listing_id,))
+    
+    if not row or row[3] != user_id:
+        return JSONResponse({
+            'status': 'error',
+            'message': 'Not found'
+        })
+    
+    if row[0] != 'pending':
+        return JSONResponse({'status': row[0], 'position': None, 'eta_seconds': 0})
+    
+    ahead = await run_transaction(jobs_ahead, row[1], row[2], listing_id)
+    eta = estimate_wait(ahead + 1)
+    
+    return JSONResponse({
+        'status': row[0],
+        'position': ahead + 1,
+        'eta_seconds': int(eta),
+        'seconds_per_check': round(seconds_per_check(), 1),
+        # No point asking again before a good share of the wait has passed
+        'next_poll_seconds': int(min(300, max(10, eta / 4)))
+    })
+
+
+@router.get('/events')
+@login_required
+async def listing_events(request: Request):
+    """Server-Sent Events stream of the user's listing status changes"""
+    user_id = (await get_session(request))['uid']
+    
+    if at_capacity(user_id):
+        return too_many_requests('Too many open event streams', SSE_HEARTBEAT_SECONDS)
+    
+    # Sent by EventSource on reconnect so missed events can be replayed
+    last_event_id = request.headers.get('last-event-id', '')
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else None
+    
+    return StreamingResponse(
+        stream(user_id, last_event_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _record_transfer(cursor, listing_id, user_id, campaign_id, receiver_session_id, price, purchase_message):
+    """
+    Mark listing sold, credit the seller and queue the purchase message
+    Returns: False (nothing written) if the listing is no longer ready_for_transfer
+    """
+    now = int(time.time())
+    
+    # Conditional: a second worker or request that also verified the transfer changes nothing
+    cursor.execute(
+        'UPDATE listings SET status="sold", transferred_ts=? WHERE id=? AND status="ready_for_transfer"',
+        (now, listing_id)
+    )
+    if cursor.rowcount == 0:
+        return False
+    
+    # Credit the seller (ledger entry + materialized balance)
+    post_entry(cursor, user_id, to_cents(price), 'sale', listing_id)
+    
+    # Update campaign sold count
+    cursor.execute(
+        'UPDATE campaigns SET sold_count = sold_count + 1 WHERE id=?',
+        (campaign_id,)
+    )
+    
+    # Update receiver session group count
+    cursor.execute(
+        'UPDATE admin_sessions SET groups_received = groups_received + 1 WHERE id=?',
+        (receiver_session_id,)
+    )
+    
+    enqueue(cursor, 'purchase_message', f'purchase_message:{listing_id}', purchase_message, receiver_session_id)
+    return True
+
+
+@router.post('/transfer/{listing_id}')
+@login_required
+async def confirm_transfer(request: Request, listing_id: int):
+    """Confirm ownership transfer and send purchase message"""
+    user = await get_current_user(request)
+    
+    # Duplicate clicks join the check already running instead of repeating the Telegram work
+    try:
+        result = await single_flight(('transfer', listing_id, user['id']), lambda: _transfer(user, listing_id))
+    except LockBusy as e:
+        return too_many_requests(str(e), 1)
+    return JSONResponse(result)
+
+
+async def _transfer(user, listing_id):
+    """Verify the transfer on Telegram and record the sale; returns the JSON result"""
+    row = await fetch_one(
+        '''SELECT l.user_id, l.receiver_session, l.group_link, l.campaign_id, l.price_usd, l.status, c.year
+           FROM listings l
+           JOIN campaigns c ON l.campaign_id = c.id
+           WHERE l.id=?''',
+        (listing_id,)
+    )
+    
+    if not row or row[0] != user['id']:
+        return {
+            'status': 'error',
+            'message': 'Not found'
+        }
+    
+    if row[5] != 'ready_for_transfer':
+        return {
+            'status': 'error',
+            'message': 'Listing not ready for transfer'
+        }
+    
+    receiver_session_id = row[1]
+    group_link = row[2]
+    campaign_year = row[6]
+    
+    if not receiver_session_id or receiver_session_id not in active_telegram_clients:
+        return {
+            'status': 'error',
+            'message': 'Receiver session offline'
+        }
+    
+    # Verify ownership
+    verified, message = await verify_receiver_ownership(receiver_session_id, group_link)
+    
+    if not verified:
+        return {
+            'status': 'error',
+            'message': message
+        }
+    
+    # Process successful transfer; the purchase message is sent by the outbox dispatcher
+    purchase_message = {
+        'group_link': group_link,
+        'year': campaign_year,
+        'seller_username': user['telegram_username'],
+        'price': row[4],
+        'date': datetime.now().strftime('%B %d, %Y')
+    }
+    recorded = await run_transaction(
+        _record_transfer, listing_id, user['id'], row[3], receiver_session_id, row[4], purchase_message
+    )
+    if not recorded:
+        return {
+            'status': 'error',
+            'message': 'Listing not ready for transfer'
+        }
+    
+    wake_outbox()
+    invalidate_campaigns()  # sold_count changed
+    invalidate_user(user['id'])  # balance changed
+    publish_status(user['id'], listing_id, 'sold', group_link=group_link, amount=row[4])
+    
+    return {
+        'status': 'success',
+        'amount': row[4],
+        'message_queued': True
+    }
\ No newline at end of file
@@ -1,396 +1,449 @@
-"""
-User-related routes: login, register, profile, withdraw
-"""
-import time
-import sqlite3  # ADD THIS IMPORT
-from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from jinja2 import Template
-
-from auth import get_current_user, login_required
-from database import get_connection, create_user, verify_user_password
-from config import USDT_NETWORK, MIN_WITHDRAWAL_AMOUNT
-from templates.template_loader import load_template
-
-router = APIRouter()
-
-
-@router.get('/', response_class=HTMLResponse)
-async def index(request: Request):
-    """Home page"""
-    user = get_current_user(request)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get campaigns
-    cursor.execute(
-    'SELECT id, title, year, month, price_usd, target_count, sold_count FROM campaigns ORDER BY id DESC'
-    )
-    campaigns = []
-    for row in cursor.fetchall():
-        target_count = row[5]
-        sold_count = row[6]
-        progress = int((sold_count / target_count) * 100) if target_count > 0 else 0
-        campaigns.append({
-            'id': row[0],
-            'title': row[1],
-            'year': row[2],
-            'month': row[3],
-            'price_usd': row[4],
-            'target_count': target_count,
-            'sold_count': sold_count,
-            'progress': progress
-        })
-
-
-    
-    # Get user listings if logged in
-    user_listings = []
-    if user:
-        cursor.execute(
-            '''SELECT l.id, l.group_link, l.status, c.title, l.price_usd, l.created_ts 
-               FROM listings l 
-               LEFT JOIN campaigns c ON l.campaign_id = c.id 
-               WHERE l.user_id = ? 
-               ORDER BY l.created_ts DESC LIMIT 5''',
-            (user['id'],)
-        )
-        for row in cursor.fetchall():
-            user_listings.append({
-                'id': row[0],
-                'group_link': row[1],
-                'status': row[2],
-                'campaign_title': row[3],
-                'price_usd': row[4],
-                'created_ts': time.strftime('%Y-%m-%d', time.localtime(row[5]))
-            })
-    
-    conn.close()
-    
-    return load_template('index.html', {
-        'user': user,
-        'campaigns': campaigns,
-        'user_listings': user_listings,
-        'network': USDT_NETWORK,
-        'is_admin': user and user.get('is_admin')
-    })
-
-
-@router.get('/login', response_class=HTMLResponse)
-async def login_form(request: Request, error: str = None):
-    """Login page"""
-    return load_template('login.html', {'error': error})
-
-
-@router.post('/login')
-async def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    """Process login"""
-    user_id = verify_user_password(username, password)
-    
-    if not user_id:
-        return RedirectResponse('/login?error=Invalid+credentials', status_code=303)
-    
-    response = RedirectResponse('/', status_code=303)
-    response.set_cookie('uid', str(user_id), httponly=True, max_age=2592000)
-    return response
-
-
-@router.get('/register', response_class=HTMLResponse)
-async def register_form(request: Request, error: str = None):
-    """Registration page"""
-    return load_template('register.html', {'error': error})
-
-
-@router.post('/register')
-async def register(
-    request: Request,
-    username: str = Form(...),
-    password: str = Form(...),
-    telegram_username: str = Form(...),
-    usdt_wallet: str = Form(...)
-):
-    """Process registration"""
-    user_id = create_user(username, password, telegram_username, usdt_wallet, int(time.time()))
-    
-    if not user_id:
-        return RedirectResponse('/register?error=Username+already+exists', status_code=303)
-    
-    response = RedirectResponse('/', status_code=303)
-    response.set_cookie('uid', str(user_id), httponly=True, max_age=2592000)
-    return response
-
-
-@router.get('/logout')
-async def logout():
-    """Logout"""
-    response = RedirectResponse('/')
-    response.delete_cookie('uid')
-    return response
-
-
-@router.get('/campaigns', response_class=HTMLResponse)
-async def campaigns_page(request: Request):
-    """All campaigns page"""
-    user = get_current_user(request)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-    'SELECT id, title, year, month, price_usd, target_count, sold_count FROM campaigns ORDER BY id DESC'
-    )
-    campaigns = []
-    for row in cursor.fetchall():
-        target_count = row[5]
-        sold_count = row[6]
-        progress = int((sold_count / target_count) * 100) if target_count > 0 else 0
-        campaigns.append({
-            'id': row[0],
-            'title': row[1],
-            'year': row[2],
-            'month': row[3],
-            'price_usd': row[4],
-            'target_count': target_count,
-            'sold_count': sold_count,
-            'progress': progress
-        })
-
-    
-    conn.close()
-    
-    return load_template('campaigns.html', {'user': user, 'campaigns': campaigns})
-
-
-@router.get('/profile', response_class=HTMLResponse)
-@login_required
-async def profile(request: Request):
-    """User profile page"""
-    user = get_current_user(request)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get stats
-    cursor.execute('SELECT COUNT(*) FROM listings WHERE user_id=?', (user['id'],))
-    total = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) FROM listings WHERE user_id=? AND status="sold"', (user['id'],))
-    sold = cursor.fetchone()[0]
-    
-    stats = {'total': total, 'sold': sold}
-    
-    # Get listings
-    cursor.execute(
-        '''SELECT l.id, l.group_link, l.status, l.price_usd, l.check_log, c.title, l.created_ts, l.receiver_session 
-           FROM listings l 
-           LEFT JOIN campaigns c ON l.campaign_id = c.id 
-           WHERE l.user_id = ? 
-           ORDER BY l.created_ts DESC''',
-        (user['id'],)
-    )
-    
-    listings = []
-    for row in cursor.fetchall():
-        target_username = None
-        if row[7]:
-            cursor.execute('SELECT username FROM admin_sessions WHERE id=?', (row[7],))
-            session = cursor.fetchone()
-            if session:
-                target_username = session[0]
-        
-        listings.append({
-            'id': row[0],
-            'group_link': row[1],
-            'status': row[2],
-            'price_usd': row[3],
-            'check_log': row[4],
-            'campaign_title': row[5],
-            'created_ts': time.strftime('%Y-%m-%d', time.localtime(row[6])),
-            'target_username': target_username
-        })
-    
-    # Get withdrawals
-    cursor.execute(
-        'SELECT amount_usdt, seller_usdt, status, created_ts FROM withdrawals WHERE user_id=? ORDER BY created_ts DESC',
-        (user['id'],)
-    )
-    
-    withdrawals = []
-    for row in cursor.fetchall():
-        withdrawals.append({
-            'amount_usdt': row[0],
-            'seller_usdt': row[1],
-            'status': row[2],
-            'created_ts': time.strftime('%Y-%m-%d', time.localtime(row[3]))
-        })
-    
-    conn.close()
-    
-    return load_template('profile.html', {
-        'user': user,
-        'stats': stats,
-        'listings': listings,
-        'withdrawals': withdrawals
-    })
-
-
-@router.get('/withdraw', response_class=HTMLResponse)
-@login_required
-async def withdraw_page(request: Request):
-    """Withdrawal page"""
-    user = get_current_user(request)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get pending withdrawals
-    cursor.execute(
-        'SELECT amount_usdt, status, created_ts FROM withdrawals WHERE user_id=? AND status="pending" ORDER BY created_ts DESC',
-        (user['id'],)
-    )
-    
-    pending_withdrawals = []
-    for row in cursor.fetchall():
-        pending_withdrawals.append({
-            'amount_usdt': row[0],
-            'status': row[1],
-            'created_ts': time.strftime('%Y-%m-%d %H:%M', time.localtime(row[2]))
-        })
-    
-    conn.close()
-    
-    return load_template('withdraw.html', {
-        'user': user,
-        'network': USDT_NETWORK,
-        'pending_withdrawals': pending_withdrawals,
-        'min_amount': MIN_WITHDRAWAL_AMOUNT
-    })
-
-
-@router.post('/withdraw')
-@login_required
-async def process_withdrawal(request: Request, amount: float = Form(...)):
-    """Process withdrawal request and post to channel"""
-    user = get_current_user(request)
-    
-    if amount < MIN_WITHDRAWAL_AMOUNT:
-        return RedirectResponse(f'/withdraw?error=Minimum+withdrawal+is+${MIN_WITHDRAWAL_AMOUNT}', status_code=303)
-    
-    if amount > user['balance']:
-        return RedirectResponse('/withdraw?error=Insufficient+balance', status_code=303)
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Start transaction
-        # 1. Deduct from user balance immediately
-        cursor.execute(
-            'UPDATE users SET balance = balance - ? WHERE id=? AND balance >= ?',
-            (amount, user['id'], amount)
-        )
-        
-        if cursor.rowcount == 0:
-            conn.close()
-            return RedirectResponse('/withdraw?error=Insufficient+balance+or+concurrent+withdrawal', status_code=303)
-        
-        # 2. Get groups that haven't been included in withdrawals yet
-        # Use try-except to handle potential missing column
-        try:
-            cursor.execute(
-                '''SELECT l.id, l.group_link, l.price_usd, l.receiver_session, a.username
-                   FROM listings l
-                   LEFT JOIN admin_sessions a ON l.receiver_session = a.id
-                   WHERE l.user_id = ? AND l.status = 'sold' AND l.included_in_withdrawal = 0
-                   ORDER BY l.transferred_ts ASC''',
-                (user['id'],)
-            )
-        except sqlite3.OperationalError:
-            # If column doesn't exist, get all sold groups
-            cursor.execute(
-                '''SELECT l.id, l.group_link, l.price_usd, l.receiver_session, a.username
-                   FROM listings l
-                   LEFT JOIN admin_sessions a ON l.receiver_session = a.id
-                   WHERE l.user_id = ? AND l.status = 'sold'
-                   ORDER BY l.transferred_ts ASC''',
-                (user['id'],)
-            )
-        
-        groups_data = cursor.fetchall()
-        
-        groups_info = []
-        listing_ids = []
-        for row in groups_data:
-            listing_ids.append(row[0])
-            groups_info.append({
-                'link': row[1],
-                'price': row[2],
-                'receiver': row[3] or 'Unknown'
-            })
-        
-        # 3. Create withdrawal record
-        cursor.execute(
-            'INSERT INTO withdrawals (user_id, seller_usdt, amount_usdt, status, created_ts) VALUES (?, ?, ?, "pending", ?)',
-            (user['id'], user['usdt_wallet'], amount, int(time.time()))
-        )
-        withdrawal_id = cursor.lastrowid
-        
-        # 4. Mark groups as included in withdrawal (if column exists)
-        if listing_ids:
-            try:
-                placeholders = ','.join('?' * len(listing_ids))
-                cursor.execute(
-                    f'UPDATE listings SET included_in_withdrawal = 1 WHERE id IN ({placeholders})',
-                    listing_ids
-                )
-            except sqlite3.OperationalError:
-                # Column doesn't exist, skip this step
-                pass
-        
-        conn.commit()
-        
-        # 5. Post to withdrawal request channel (optional)
-        try:
-            from telegram_handler import get_withdrawal_sessions, post_withdrawal_request
-            from datetime import datetime
-            
-            withdrawal_sessions = await get_withdrawal_sessions()
-            
-            if withdrawal_sessions['request']:
-                withdrawal_data = {
-                    'id': withdrawal_id,
-                    'username': user['username'],
-                    'telegram': user['telegram_username'],
-                    'amount': amount,
-                    'wallet': user['usdt_wallet'],
-                    'groups': groups_info,
-                    'date': datetime.now().strftime('%Y-%m-%d %H:%M')
-                }
-                
-                success, msg_id, error = await post_withdrawal_request(
-                    withdrawal_sessions['request'],
-                    withdrawal_data
-                )
-                
-                if success:
-                    # Update withdrawal with message ID
-                    try:
-                        cursor.execute(
-                            'UPDATE withdrawals SET withdrawal_request_msg_id = ? WHERE id = ?',
-                            (msg_id, withdrawal_id)
-                        )
-                        conn.commit()
-                    except sqlite3.OperationalError:
-                        pass  # Column doesn't exist
-        except Exception as e:
-            print(f"Warning: Failed to post withdrawal request: {e}")
-        
-        conn.close()
-        
-        return RedirectResponse('/withdraw?success=Withdrawal+requested+successfully', status_code=303)
-        
-    except Exception as e:
-        conn.rollback()
-        conn.close()
-        return RedirectResponse(f'/withdraw?error=Withdrawal+failed:+{str(e)}', status_code=303)
-    
+"""
+User-related routes: login, register, profile, withdraw
+"""
+import time
+from datetime import datetime
+from fastapi import APIRouter, Request, Form
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from jinja2 import Template
+
+from auth import (
+    get_current_user, get_user_cached, get_session, login_required, invalidate_user,
+    create_session_token, revoke_session, SESSION_COOKIE
+)
+from database import (
+    insert_user, get_user_by_username, update_password_hash, run_db, run_transaction, fetch_all
+)
+from passwords import hash_password_async, verify_password_async, PasswordHasherBusy
+from config import USDT_NETWORK, MIN_WITHDRAWAL_AMOUNT, PROFILE_PAGE_SIZE, LISTING_STATUSES, SESSION_TTL
+from campaign_cache import get_campaigns
+from fragment_cache import cached_fragment
+from outbox import enqueue, wake as wake_outbox
+from ledger import post_entry, to_cents, InsufficientBalance
+from locks import hold, LockBusy
+from templates.template_loader import load_template, stream_template
+
+router = APIRouter()
+
+
+def _load_recent_listings(cursor, user_id):
+    """The user's latest listings for the home page"""
+    cursor.execute(
+        '''SELECT l.id, l.group_link, l.status, c.title, l.price_usd, l.created_ts 
+           FROM listings l 
+           LEFT JOIN campaigns c ON l.campaign_id = c.id 
+           WHERE l.user_id = ? 
+           ORDER BY l.created_ts DESC LIMIT 5''',
+        (user_id,)
+    )
+    user_listings = []
+    for row in cursor.fetchall():
+        user_listings.append({
+            'id': row[0],
+            'group_link': row[1],
+            'status': row[2],
+            'campaign_title': row[3],
+            'price_usd': row[4],
+            'created_ts': time.strftime('%Y-%m-%d', time.localtime(row[5]))
+        })
+    
+    return user_listings
+
+
+async def _campaigns_fragment(template_name: str, campaigns: list, user) -> str:
+    """Shared campaign grid; the only per-user difference is the sell vs login button"""
+    logged_in = bool(user)
+    return await cached_fragment((template_name, logged_in), campaigns, lambda: load_template(
+        template_name, {'campaigns': campaigns, 'logged_in': logged_in}
+    ))
+
+
+@router.get('/', response_class=HTMLResponse)
+async def index(request: Request):
+    """Home page"""
+    user = await get_current_user(request)
+    
+    campaigns = await get_campaigns()
+    campaigns_html = await _campaigns_fragment('partials/home_campaigns.html', campaigns, user)
+    
+    # Anonymous visitors all get the same page: rendered once per campaign change
+    if not user:
+        return await cached_fragment(('index.html', 'anonymous'), campaigns, lambda: load_template('index.html', {
+            'user': None,
+            'campaigns_html': campaigns_html,
+            'user_listings': [],
+            'network': USDT_NETWORK,
+            'is_admin': False
+        }))
+    
+    user_listings = await run_transaction(_load_recent_listings, user['id'])
+    
+    return await load_template('index.html', {
+        'user': user,
+        'campaigns_html': campaigns_html,
+        'user_listings': user_listings,
+        'network': USDT_NETWORK,
+        'is_admin': user.get('is_admin')
+    })
+
+
+async def _start_session(user_id: int) -> RedirectResponse:
+    """Redirect home with a fresh signed session cookie"""
+    # The token only carries the id; requests re-read the user (and is_admin) through the
+    # TTL cache, so drop any cached copy and logging in picks up changes at once
+    invalidate_user(user_id)
+    user = await get_user_cached(user_id)
+    response = RedirectResponse('/', status_code=303)
+    response.set_cookie(SESSION_COOKIE, await create_session_token(user), httponly=True, samesite='lax', max_age=SESSION_TTL)
+    return response
+
+
+@router.get('/login', response_class=HTMLResponse)
+async def login_form(request: Request, error: str = None):
+    """Login page"""
+    return await load_template('login.html', {'error': error})
+
+
+@router.post('/login')
+async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    """Process login"""
+    user = await run_db(get_user_by_username, username)
+    stored = user['password_hash'] if user else None
+    
+    try:
+        valid, needs_rehash = await verify_password_async(password, stored)
+    except PasswordHasherBusy:
+        return RedirectResponse('/login?error=Too+many+login+attempts,+try+again+shortly', status_code=303)
+    
+    if not valid:
+        return RedirectResponse('/login?error=Invalid+credentials', status_code=303)
+    
+    user_id = user['id']
+    
+    # Transparent upgrade of legacy SHA-256 (or weaker scrypt) hashes
+    if needs_rehash:
+        try:
+            new_hash = await hash_password_async(password)
+            await run_db(update_password_hash, user_id, stored, new_hash)
+        except PasswordHasherBusy:
+            pass  # upgrade on a later login
+    
+    return await _start_session(user_id)
+
+
+@router.get('/register', response_class=HTMLResponse)
+async def register_form(request: Request, error: str = None):
+    """Registration page"""
+    return await load_template('register.html', {'error': error})
+
+
+@router.post('/register')
+async def register(
+    request: Request,
+    username: str = Form(...),
+    password: str = Form(...),
+    telegram_username: str = Form(...),
+    usdt_wallet: str = Form(...)
+):
+    """Process registration"""
+    try:
+        password_hash = await hash_password_async(password)
+    except PasswordHasherBusy:
+        return RedirectResponse('/register?error=Server+busy,+try+again+shortly', status_code=303)
+    
+    user_id = await run_db(insert_user, username, password_hash, telegram_username, usdt_wallet, int(time.time()))
+    
+    if not user_id:
+        return RedirectResponse('/register?error=Username+already+exists', status_code=303)
+    
+    return await _start_session(user_id)
+
+
+@router.get('/logout')
+async def logout(request: Request):
+    """Logout (the token stays revoked even if the cookie is replayed)"""
+    claims = await get_session(request)
+    if claims:
+        await revoke_session(claims)
+    
+    response = RedirectResponse('/')
+    response.delete_cookie(SESSION_COOKIE)
+    response.delete_cookie('uid')
+    return response
+
+
+@router.get('/campaigns', response_class=HTMLResponse)
+async def campaigns_page(request: Request):
+    """All campaigns page"""
+    user = await get_current_user(request)
+    campaigns = await get_campaigns()
+    campaigns_html = await _campaigns_fragment('partials/campaign_grid.html', campaigns, user)
+    
+    if not user:
+        return await cached_fragment(('campaigns.html', 'anonymous'), campaigns, lambda: load_template(
+            'campaigns.html', {'user': None, 'campaigns_html': campaigns_html}
+        ))
+    
+    return await load_template('campaigns.html', {'user': user, 'campaigns_html': campaigns_html})
+
+
+def _parse_cursor(before: str):
+    """Decode a "created_ts:id" keyset cursor, None if missing or malformed"""
+    try:
+        created_ts, listing_id = before.split(':')
+        return int(created_ts), int(listing_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _load_listings_page(cursor, user_id, before=None, status=None, campaign_id=None):
+    """
+    One page of a user's listings, newest first, receiver username joined in
+    Returns: (listings, next_cursor or None)
+    """
+    query = '''SELECT l.id, l.group_link, l.status, l.price_usd, l.check_log, c.title, l.created_ts, a.username
+               FROM listings l
+               LEFT JOIN campaigns c ON l.campaign_id = c.id
+               LEFT JOIN admin_sessions a ON l.receiver_session = a.id
+               WHERE l.user_id = ?'''
+    params = [user_id]
+    
+    if status:
+        query += ' AND l.status = ?'
+        params.append(status)
+    if campaign_id:
+        query += ' AND l.campaign_id = ?'
+        params.append(campaign_id)
+    if before:
+        query += ' AND (l.created_ts, l.id) < (?, ?)'
+        params.extend(before)
+    
+    # Fetch one extra row to know whether another page exists
+    query += ' ORDER BY l.created_ts DESC, l.id DESC LIMIT ?'
+    params.append(PROFILE_PAGE_SIZE + 1)
+    
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    
+    listings = []
+    for row in rows[:PROFILE_PAGE_SIZE]:
+        listings.append({
+            'id': row[0],
+            'group_link': row[1],
+            'status': row[2],
+            'price_usd': row[3],
+            'check_log': row[4],
+            'campaign_title': row[5],
+            'created_ts': time.strftime('%Y-%m-%d', time.localtime(row[6])),
+            'target_username': row[7]
+        })
+    
+    next_cursor = None
+    if len(rows) > PROFILE_PAGE_SIZE:
+        last = rows[PROFILE_PAGE_SIZE - 1]
+        next_cursor = f'{last[6]}:{last[0]}'
+    
+    return listings, next_cursor
+
+
+def _load_profile(cursor, user_id, status=None, campaign_id=None):
+    """Stats, first listings page and withdrawals for the profile page"""
+    # Get stats
+    cursor.execute(
+        'SELECT COUNT(*), COALESCE(SUM(status = \'sold\'), 0) FROM listings WHERE user_id=?',
+        (user_id,)
+    )
+    total, sold = cursor.fetchone()
+    
+    stats = {'total': total, 'sold': sold}
+    
+    # Get listings
+    listings, next_cursor = _load_listings_page(cursor, user_id, status=status, campaign_id=campaign_id)
+    
+    # Get withdrawals
+    cursor.execute(
+        'SELECT amount_usdt, seller_usdt, status, created_ts FROM withdrawals WHERE user_id=? ORDER BY created_ts DESC',
+        (user_id,)
+    )
+    
+    withdrawals = []
+    for row in cursor.fetchall():
+        withdrawals.append({
+            'amount_usdt': row[0],
+            'seller_usdt': row[1],
+            'status': row[2],
+            'created_ts': time.strftime('%Y-%m-%d', time.localtime(row[3]))
+        })
+    
+    return stats, listings, next_cursor, withdrawals
+
+
+def _parse_campaign_filter(campaign: str):
+    """Campaign filter from the query string ("" means all campaigns)"""
+    try:
+        return int(campaign) if campaign else None
+    except ValueError:
+        return None
+
+
+@router.get('/profile', response_class=HTMLResponse)
+@login_required
+async def profile(request: Request, status: str = None, campaign: str = None):
+    """User profile page"""
+    user = await get_current_user(request)
+    
+    status = status if status in LISTING_STATUSES else None
+    campaign_id = _parse_campaign_filter(campaign)
+    
+    stats, listings, next_cursor, withdrawals = await run_transaction(
+        _load_profile, user['id'], status, campaign_id
+    )
+    campaigns = await get_campaigns()
+    
+    return stream_template('profile.html', {
+        'user': user,
+        'stats': stats,
+        'listings': listings,
+        'next_cursor': next_cursor,
+        'withdrawals': withdrawals,
+        'campaigns': campaigns,
+        'statuses': LISTING_STATUSES,
+        'filter_status': status,
+        'filter_campaign': campaign_id
+    })
+
+
+@router.get('/profile/listings')
+@login_required
+async def profile_listings(request: Request, before: str = None, status: str = None, campaign: str = None):
+    """Next page of the user's listings as JSON (infinite scroll)"""
+    user_id = (await get_session(request))['uid']
+    
+    status = status if status in LISTING_STATUSES else None
+    
+    listings, next_cursor = await run_transaction(
+        _load_listings_page, user_id, _parse_cursor(before), status, _parse_campaign_filter(campaign)
+    )
+    
+    return JSONResponse({
+        'listings': listings,
+        'next_cursor': next_cursor
+    })
+
+
+@router.get('/withdraw', response_class=HTMLResponse)
+@login_required
+async def withdraw_page(request: Request):
+    """Withdrawal page"""
+    user = await get_current_user(request)
+    
+    # Get pending withdrawals
+    rows = await fetch_all(
+        'SELECT amount_usdt, status, created_ts FROM withdrawals WHERE user_id=? AND status="pending" ORDER BY created_ts DESC',
+        (user['id'],)
+    )
+    
+    pending_withdrawals = []
+    for row in rows:
+        pending_withdrawals.append({
+            'amount_usdt': row[0],
+            'status': row[1],
+            'created_ts': time.strftime('%Y-%m-%d %H:%M', time.localtime(row[2]))
+        })
+    
+    return await load_template('withdraw.html', {
+        'user': user,
+        'network': USDT_NETWORK,
+        'pending_withdrawals': pending_withdrawals,
+        'min_amount': MIN_WITHDRAWAL_AMOUNT
+    })
+
+
+def _create_withdrawal(cursor, user, amount):
+    """
+    Record the withdrawal, deduct the balance, claim its sold groups and queue the channel post
+    Returns: withdrawal_id; raises InsufficientBalance (rolling everything back) if the balance is too low
+    """
+    # 1. Create withdrawal record
+    cursor.execute(
+        'INSERT INTO withdrawals (user_id, seller_usdt, amount_usdt, status, created_ts) VALUES (?, ?, ?, "pending", ?)',
+        (user['id'], user['usdt_wallet'], amount, int(time.time()))
+    )
+    withdrawal_id = cursor.lastrowid
+    
+    # 2. Deduct from user balance immediately (ledger entry + materialized balance)
+    post_entry(cursor, user['id'], -to_cents(amount), 'withdrawal', withdrawal_id)
+    
+    # 3. Get groups that haven't been included in withdrawals yet
+    cursor.execute(
+        '''SELECT l.id, l.group_link, l.price_usd, l.receiver_session, a.username
+           FROM listings l
+           LEFT JOIN admin_sessions a ON l.receiver_session = a.id
+           WHERE l.user_id = ? AND l.status = 'sold' AND l.included_in_withdrawal = 0
+           ORDER BY l.transferred_ts ASC''',
+        (user['id'],)
+    )
+    
+    groups_data = cursor.fetchall()
+    
+    groups_info = []
+    listing_ids = []
+    for row in groups_data:
+        listing_ids.append(row[0])
+        groups_info.append({
+            'link': row[1],
+            'price': row[2],
+            'receiver': row[3] or 'Unknown'
+        })
+    
+    # 4. Mark groups as included in withdrawal (only those no other withdrawal claimed meanwhile)
+    if listing_ids:
+        placeholders = ','.join('?' * len(listing_ids))
+        cursor.execute(
+            f'UPDATE listings SET included_in_withdrawal = 1 WHERE id IN ({placeholders}) AND included_in_withdrawal = 0',
+            listing_ids
+        )
+    
+    # 5. Post to the withdrawal request channel (sent by the outbox dispatcher)
+    enqueue(cursor, 'withdrawal_request', f'withdrawal_request:{withdrawal_id}', {
+        'id': withdrawal_id,
+        'username': user['username'],
+        'telegram': user['telegram_username'],
+        'amount': amount,
+        'wallet': user['usdt_wallet'],
+        'groups': groups_info,
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M')
+    })
+    
+    return withdrawal_id
+
+
+@router.post('/withdraw')
+@login_required
+async def process_withdrawal(request: Request, amount: float = Form(...)):
+    """Process withdrawal request and post to channel"""
+    user = await get_current_user(request)
+    
+    if amount < MIN_WITHDRAWAL_AMOUNT:
+        return RedirectResponse(f'/withdraw?error=Minimum+withdrawal+is+${MIN_WITHDRAWAL_AMOUNT}', status_code=303)
+    
+    if amount > user['balance']:
+        return RedirectResponse('/withdraw?error=Insufficient+balance', status_code=303)
+    
+    try:
+        try:
+            # One withdrawal per user at a time: concurrent ones would claim the same sold groups
+            async with hold(('withdraw', user['id'])):
+                await run_transaction(_create_withdrawal, user, amount)
+        except InsufficientBalance:
+            return RedirectResponse('/withdraw?error=Insufficient+balance+or+concurrent+withdrawal', status_code=303)
+        except LockBusy:
+            return RedirectResponse('/withdraw?error=Another+withdrawal+is+still+being+processed', status_code=303)
+        
+        invalidate_user(user['id'])  # balance changed
+        wake_outbox()
+        
+        return RedirectResponse('/withdraw?success=Withdrawal+requested+successfully', status_code=303)
+        
+    except Exception as e:
+        return RedirectResponse(f'/withdraw?error=Withdrawal+failed:+{str(e)}', status_code=303)
@@ -0,0 +1,104 @@
+"""
+Seller-fair scheduling of the listings queue (start-time fair queueing)
+
+Each listing gets a virtual start time when queued: 1/priority after the later
+of the global virtual clock and the seller's last queued listing, so one
+seller's bulk upload only delays that seller.
+"""
+import time
+from typing import List, Optional, Tuple
+
+from config import CHECK_CLAIM_LEASE, WORKER_ID
+
+VCLOCK_KEY = 'scheduler_vclock'
+
+
+def _vclock(cursor) -> float:
+    cursor.execute('SELECT value FROM system_settings WHERE key = ?', (VCLOCK_KEY,))
+    row = cursor.fetchone()
+    return float(row[0]) if row else 0.0
+
+
+def next_vtimes(cursor, user_id: int, priority: int, count: int) -> List[float]:
+    """Virtual start times for count new listings of one seller at the given campaign priority"""
+    # Partial index idx_listings_pending_user: MAX over the seller's pending listings only
+    cursor.execute("SELECT MAX(vtime) FROM listings WHERE user_id = ? AND status = 'pending'", (user_id,))
+    seller_last = cursor.fetchone()[0] or 0.0
+    start = max(_vclock(cursor), seller_last)
+    step = 1.0 / max(priority or 1, 1)
+    return [start + step * (i + 1) for i in range(count)]
+
+
+def claim_next(cursor) -> Optional[Tuple[int, int, str, int]]:
+    """
+    Take the next listing under the fair policy and mark it 'checking'
+    Run under run_immediate so two workers never claim the same listing
+    Returns: (listing_id, campaign_id, group_link, user_id) or None when the queue is empty
+    """
+    # idx_listings_queue: first entry of (expedite DESC, vtime, id) among pending
+    cursor.execute(
+        '''SELECT id, campaign_id, group_link, user_id, vtime FROM listings
+           WHERE status = 'pending'
+           ORDER BY expedite DESC, vtime ASC, id ASC LIMIT 1'''
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+
+    listing_id, campaign_id, group_link, user_id, vtime = row
+    cursor.execute(
+        "UPDATE listings SET status = 'checking', claimed_by = ?, claimed_ts = ? WHERE id = ?",
+        (WORKER_ID, time.time(), listing_id)
+    )
+
+    # The clock only moves forward; expedited jobs may carry an older vtime
+    if vtime > _vclock(cursor):
+        cursor.execute(
+            'REPLACE INTO system_settings (key, value) VALUES (?, ?)',
+            (VCLOCK_KEY, repr(vtime))
+        )
+    return listing_id, campaign_id, group_link, user_id
+
+
+def jobs_ahead(cursor, expedite: int, vtime: float, listing_id: int) -> int:
+    """Pending listings claim_next would hand out before this one (two index range counts)"""
+    cursor.execute(
+        "SELECT COUNT(*) FROM listings WHERE status = 'pending' AND expedite > ?",
+        (expedite,)
+    )
+    ahead = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT COUNT(*) FROM listings WHERE status = 'pending' AND expedite = ? AND (vtime, id) < (?, ?)",
+        (expedite, vtime, listing_id)
+    )
+    return ahead + cursor.fetchone()[0]
+
+
+def requeue(cursor, listing_id: int):
+    """Put a claimed listing back at its original place in the queue"""
+    cursor.execute("UPDATE listings SET status = 'pending' WHERE id = ? AND status = 'checking'", (listing_id,))
+
+
+def release_stale_claims(cursor) -> int:
+    """
+    Requeue listings claimed more than CHECK_CLAIM_LEASE ago (their worker
+    died mid-check); listings other live checkers are working on stay claimed
+    """
+    cursor.execute(
+        """UPDATE listings SET status = 'pending', claimed_by = NULL
+           WHERE status = 'checking' AND (claimed_ts IS NULL OR claimed_ts < ?)""",
+        (time.time() - CHECK_CLAIM_LEASE,)
+    )
+    return cursor.rowcount
+
+
+def set_campaign_priority(cursor, campaign_id: int, priority: int, expedite: bool):
+    """Change a campaign's weight and expedite flag; expedite applies to its queued listings too"""
+    cursor.execute(
+        'UPDATE campaigns SET priority = ?, expedite = ? WHERE id = ?',
+        (priority, 1 if expedite else 0, campaign_id)
+    )
+    cursor.execute(
+        "UPDATE listings SET expedite = ? WHERE campaign_id = ? AND status = 'pending'",
+        (1 if expedite else 0, campaign_id)
+    )
@@ -0,0 +1,71 @@
+"""
+Fingerprinted static URLs and a StaticFiles that serves the precompressed variants
+"""
+import os
+import json
+import mimetypes
+import anyio
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+from starlette.responses import Response
+
+from config import STATIC_DIR, STATIC_BUILD_DIR, STATIC_IMMUTABLE_MAX_AGE
+
+MANIFEST_PATH = os.path.join(STATIC_DIR, STATIC_BUILD_DIR, 'manifest.json')
+
+# Preferred first; the files are written next to the fingerprinted asset by build_static.py
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _load_manifest() -> dict:
+    """{source name: fingerprinted path}, empty until build_static.py has run"""
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+_manifest = _load_manifest()
+
+
+def static_url(name: str) -> str:
+    """URL of a static asset: its fingerprinted copy when built, the source file otherwise"""
+    return '/static/' + _manifest.get(name, name)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Fingerprinted files are cached for a year and served as their .br/.gz copy
+    when the browser accepts it; anything else is revalidated (ETag) on each use
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        immutable = path.startswith(STATIC_BUILD_DIR + '/')
+        response = None
+        if immutable and scope['method'] in ('GET', 'HEAD'):
+            response = await self._precompressed(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+
+        if immutable:
+            response.headers['Cache-Control'] = f'public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    async def _precompressed(self, path: str, scope: Scope):
+        accepted = Headers(scope=scope).get('accept-encoding', '')
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is None:
+                continue
+            response = self.file_response(full_path, stat_result, scope)
+            response.headers['Content-Type'] = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+        return None
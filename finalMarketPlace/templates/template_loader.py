@@ -1,32 +1,82 @@
-"""
-Template loader utility
-"""
-import os
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-
-# Get templates directory
-template_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Create Jinja2 environment
-env = Environment(
-    loader=FileSystemLoader(template_dir),
-    autoescape=select_autoescape(['html', 'xml'])
-)
-
-
-def load_template(template_name: str, context: dict = None) -> str:
-    """
-    Load and render a template
-    
-    Args:
-        template_name: Name of template file
-        context: Dictionary of template variables
-        
-    Returns:
-        Rendered HTML string
-    """
-    if context is None:
-        context = {}
-    
-    template = env.get_template(template_name)
-    return template.render(**context)
\ No newline at end of file
+"""
+Template loader utility
+"""
+import os
+from typing import AsyncIterator
+from fastapi.responses import StreamingResponse
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+from config import TEMPLATE_CACHE_DIR, TEMPLATE_AUTO_RELOAD, TEMPLATE_STREAM_CHUNK
+from static_assets import static_url
+
+# Get templates directory
+template_dir = os.path.dirname(os.path.abspath(__file__))
+
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+
+# Create Jinja2 environment: async rendering, compiled bytecode cached on disk
+env = Environment(
+    loader=FileSystemLoader(template_dir),
+    autoescape=select_autoescape(['html', 'xml']),
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    enable_async=True
+)
+env.globals['static_url'] = static_url
+
+
+def warm_templates() -> int:
+    """Compile every page template up front (from the bytecode cache when it is fresh)"""
+    names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+async def load_template(template_name: str, context: dict = None) -> str:
+    """
+    Load and render a template
+    
+    Args:
+        template_name: Name of template file
+        context: Dictionary of template variables
+        
+    Returns:
+        Rendered HTML string
+    """
+    if context is None:
+        context = {}
+    
+    template = env.get_template(template_name)
+    return await template.render_async(**context)
+
+
+async def _coalesce(parts: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Join Jinja's many small output fragments into TEMPLATE_STREAM_CHUNK-sized writes"""
+    buffer = []
+    size = 0
+    async for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= TEMPLATE_STREAM_CHUNK:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_template(template_name: str, context: dict = None) -> StreamingResponse:
+    """
+    Render a template as a streamed response, for pages with long loops
+    The head of the page reaches the browser while the rest still renders
+    """
+    template = env.get_template(template_name)
+    return StreamingResponse(
+        _coalesce(template.generate_async(**(context or {}))),
+        media_type='text/html; charset=utf-8'
+    )
+
+
+if __name__ == '__main__':
+    # Run at image build time so fresh workers start from compiled bytecode
+    print(f"Compiled {warm_templates()} templates into {TEMPLATE_CACHE_DIR}")
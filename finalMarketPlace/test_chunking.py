@@ -0,0 +1,78 @@
+"""
+Checks for Telegram message sizing: UTF-16 length and packing lines into
+messages that fit the limit
+
+    python test_chunking.py    (or: python -m pytest test_chunking.py)
+"""
+from telegram_handler import telegram_length, chunk_lines
+from config import TELEGRAM_MESSAGE_LIMIT
+
+EMOJI = '😀'  # outside the BMP: two UTF-16 code units
+
+
+def test_telegram_length_counts_utf16_units():
+    """Emoji count as two characters, BMP text as one"""
+    assert telegram_length('') == 0
+    assert telegram_length('abc') == 3
+    assert telegram_length('é✅') == 2
+    assert telegram_length(EMOJI) == 2
+    assert telegram_length(f"👤 @{'a' * 10}") == 14
+
+
+def test_emoji_at_the_limit():
+    """A block ending in an emoji exactly at the limit stays one message; one more unit spills over"""
+    limit = 20
+    line = 'a' * (limit - 2) + EMOJI
+    assert list(chunk_lines([line], limit)) == [line]
+
+    lines = ['a' * 9, 'b' * 8 + EMOJI]  # 9 + newline + 10 = 20
+    assert list(chunk_lines(lines, limit)) == ['\n'.join(lines)]
+
+    lines = ['a' * 10, 'b' * 8 + EMOJI]  # 21
+    assert list(chunk_lines(lines, limit)) == lines
+
+    chunks = list(chunk_lines([EMOJI * 3] * 7, limit))
+    assert all(telegram_length(chunk) <= limit for chunk in chunks)
+    assert '\n'.join(chunks) == '\n'.join([EMOJI * 3] * 7)
+
+
+def test_long_line_is_cut():
+    """A single line longer than the limit is cut to it, never leaving half an emoji"""
+    limit = 20
+    assert list(chunk_lines(['x' * 50], limit)) == ['x' * limit]
+
+    # The emoji would straddle the limit: its first half is dropped, not sent broken
+    chunks = list(chunk_lines(['a' * (limit - 1) + EMOJI + 'tail'], limit))
+    assert chunks == ['a' * (limit - 1)]
+
+    chunks = list(chunk_lines(['short', 'y' * 50, 'after'], limit))
+    assert chunks == ['short', 'y' * limit, 'after']
+
+
+def test_default_limit_and_order():
+    """With the default limit every message fits and lines keep their order"""
+    lines = [f"{i} {EMOJI} " + 'z' * (i % 300) for i in range(2000)]
+    chunks = list(chunk_lines(iter(lines)))
+    assert len(chunks) > 1
+    assert all(telegram_length(chunk) <= TELEGRAM_MESSAGE_LIMIT for chunk in chunks)
+    assert '\n'.join(chunks).split('\n') == lines
+    assert list(chunk_lines([])) == []
+
+
+def main():
+    """Run all tests"""
+    tests = [test_telegram_length_counts_utf16_units, test_emoji_at_the_limit, test_long_line_is_cut, test_default_limit_and_order]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ PASS: {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"✗ FAIL: {test.__doc__}: {e!r}")
+    return failed == 0
+
+
+if __name__ == '__main__':
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,174 @@
+"""
+Checks for the balance ledger: cents conversion, guarded debits, one
+credit per sale and reconciliation against the materialized balance
+
+    python test_ledger.py    (or: python -m pytest test_ledger.py)
+"""
+import os
+import sqlite3
+import tempfile
+from decimal import Decimal
+
+from migrations import migrate
+from ledger import to_cents, post_entry, reconcile, InsufficientBalance
+
+
+class _SaleDuringReconcile:
+    """Cursor that lets another connection post a sale right after reconcile reads top_id"""
+
+    def __init__(self, cursor, other: sqlite3.Connection):
+        self._cursor = cursor
+        self._other = other
+        self.blocked = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, params=()):
+        result = self._cursor.execute(sql, params)
+        if 'MAX(id), 0) FROM balance_ledger' in sql and self.blocked is None:
+            try:
+                post_entry(self._other.cursor(), 1, 250, 'sale', 2)
+                self.blocked = False
+            except sqlite3.OperationalError:  # database is locked
+                self.blocked = True
+        return result
+
+
+def _database() -> sqlite3.Connection:
+    """Migrated scratch database with one seller, campaign, receiver session and ready listing"""
+    path = os.path.join(tempfile.mkdtemp(prefix='test_ledger_'), 'ledger.db')
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    migrate(conn)
+    conn.execute("INSERT INTO users (username, password_hash, created_ts) VALUES ('seller', 'x', 0)")
+    conn.execute("INSERT INTO campaigns (title, year, price_usd, target_count, created_ts) VALUES ('2016', 2016, 5, 10, 0)")
+    conn.execute("INSERT INTO admin_sessions (session_text, username, session_type, status) VALUES ('s', 'recv', 'receiver', 'ready')")
+    conn.execute(
+        '''INSERT INTO listings (user_id, campaign_id, group_link, price_usd, status, receiver_session, created_ts)
+           VALUES (1, 1, 't.me/group', 12.345, 'ready_for_transfer', 1, 0)'''
+    )
+    return conn
+
+
+def _balance(conn) -> int:
+    return conn.execute('SELECT balance_cents FROM users WHERE id = 1').fetchone()[0]
+
+
+def test_to_cents_rounding():
+    """to_cents rounds half up on the decimal value, not the float"""
+    assert to_cents(10) == 1000
+    assert to_cents(12.345) == 1235
+    assert to_cents('0.005') == 1
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents(Decimal('-1.005')) == -101
+    assert to_cents('19.99') == 1999
+
+
+def test_overdraft_is_refused():
+    """A debit larger than the balance raises and leaves no ledger row"""
+    conn = _database()
+    cursor = conn.cursor()
+    post_entry(cursor, 1, 500, 'sale', 1)
+
+    try:
+        post_entry(cursor, 1, -501, 'withdrawal', 1)
+        assert False, 'overdraft was accepted'
+    except InsufficientBalance:
+        pass
+
+    assert _balance(conn) == 500
+    assert conn.execute("SELECT COUNT(*) FROM balance_ledger WHERE kind = 'withdrawal'").fetchone()[0] == 0
+
+    post_entry(cursor, 1, -500, 'withdrawal', 2)
+    assert _balance(conn) == 0
+    assert conn.execute('SELECT balance FROM users WHERE id = 1').fetchone()[0] == 0
+
+
+def test_duplicate_transfer_credits_once():
+    """Recording the same sale twice credits the seller once"""
+    from routes.listing_routes import _record_transfer
+
+    conn = _database()
+    cursor = conn.cursor()
+    message = {'group_link': 't.me/group', 'year': 2016, 'seller_username': '@seller', 'price': 12.345, 'date': ''}
+
+    assert _record_transfer(cursor, 1, 1, 1, 1, 12.345, message) is True
+    assert _record_transfer(cursor, 1, 1, 1, 1, 12.345, message) is False
+
+    assert _balance(conn) == 1235
+    assert conn.execute("SELECT COUNT(*) FROM balance_ledger WHERE kind = 'sale'").fetchone()[0] == 1
+    assert conn.execute('SELECT sold_count FROM campaigns WHERE id = 1').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0] == 1
+
+    # The ledger itself also refuses a second entry for the same sale
+    try:
+        post_entry(cursor, 1, 1235, 'sale', 1)
+        assert False, 'second sale entry was accepted'
+    except sqlite3.IntegrityError:
+        pass
+
+
+def test_reconcile_flags_hand_edit():
+    """reconcile reports a balance_cents edited outside the ledger, and only that user"""
+    conn = _database()
+    conn.execute("INSERT INTO users (username, password_hash, created_ts) VALUES ('other', 'x', 0)")
+    cursor = conn.cursor()
+    post_entry(cursor, 1, 700, 'sale', 1)
+    post_entry(cursor, 2, 300, 'sale', 2)
+
+    checked, mismatches = reconcile(cursor)
+    assert checked == 2 and mismatches == []
+
+    conn.execute('UPDATE users SET balance_cents = 99999 WHERE id = 1')
+    _, mismatches = reconcile(cursor)
+    assert mismatches == [(1, 700, 99999)]
+
+    # Incremental: new entries are added on top of the checkpoint
+    conn.execute('UPDATE users SET balance_cents = 700 WHERE id = 1')
+    post_entry(cursor, 1, -200, 'withdrawal', 1)
+    _, mismatches = reconcile(cursor)
+    assert mismatches == []
+    assert conn.execute('SELECT balance_cents FROM ledger_checkpoints WHERE user_id = 1').fetchone()[0] == 500
+
+
+def test_reconcile_snapshot_ignores_concurrent_sale():
+    """A sale committing during a reconcile pass is not reported as a mismatch"""
+    conn = _database()
+    post_entry(conn.cursor(), 1, 700, 'sale', 1)
+    other = sqlite3.connect(conn.execute('PRAGMA database_list').fetchone()[2], isolation_level=None, timeout=0)
+
+    # As reconciliation_worker runs it (run_immediate): the sale waits for the pass
+    conn.execute('BEGIN IMMEDIATE')
+    cursor = _SaleDuringReconcile(conn.cursor(), other)
+    checked, mismatches = reconcile(cursor)
+    conn.execute('COMMIT')
+    assert cursor.blocked is True
+    assert mismatches == []
+
+    post_entry(other.cursor(), 1, 250, 'sale', 2)
+    _, mismatches = reconcile(conn.cursor())
+    assert mismatches == []
+    assert conn.execute('SELECT balance_cents FROM ledger_checkpoints WHERE user_id = 1').fetchone()[0] == 950
+
+
+def main():
+    """Run all tests"""
+    tests = [
+        test_to_cents_rounding, test_overdraft_is_refused, test_duplicate_transfer_credits_once,
+        test_reconcile_flags_hand_edit, test_reconcile_snapshot_ignores_concurrent_sale
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ PASS: {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"✗ FAIL: {test.__doc__}: {e!r}")
+    return failed == 0
+
+
+if __name__ == '__main__':
+    success = main()
+    raise SystemExit(0 if success else 1)
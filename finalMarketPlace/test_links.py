@@ -0,0 +1,82 @@
+"""
+Checks for the shared Telegram link parser: canonical forms, invite links,
+reserved paths and rejected input
+
+    python test_links.py    (or: python -m pytest test_links.py)
+"""
+from links import parse_link
+
+
+def test_public_link_variants():
+    """Every spelling of a public group link gives the same lowercased canonical form"""
+    variants = [
+        'https://t.me/MyGroup',
+        'http://t.me/mygroup',
+        'http://www.telegram.me/mygroup/',
+        'telegram.me/MYGROUP',
+        't.me/MyGroup?start=1',
+        'T.ME/s/MyGroup/123',
+        '@MyGroup',
+        '  "t.me/mygroup"  ',
+    ]
+    for raw in variants:
+        link = parse_link(raw)
+        assert link.kind == 'public', raw
+        assert link.username == 'mygroup', raw
+        assert link.canonical == 't.me/mygroup', raw
+        assert link.peer == 'mygroup' and link.ok
+
+
+def test_invite_link_variants():
+    """+hash and joinchat/ links give t.me/+<hash>, keeping the hash's case"""
+    for raw in ['https://t.me/+AbCdEfGh12', 't.me/joinchat/AbCdEfGh12', 'telegram.me/+AbCdEfGh12/', 'HTTPS://T.ME/JOINCHAT/AbCdEfGh12']:
+        link = parse_link(raw)
+        assert link.kind == 'invite', raw
+        assert link.invite_hash == 'AbCdEfGh12', raw
+        assert link.canonical == 't.me/+AbCdEfGh12', raw
+        assert link.peer == 'AbCdEfGh12' and link.ok
+
+    assert parse_link('t.me/+abcdefgh12').canonical != parse_link('t.me/+ABCDEFGH12').canonical
+
+
+def test_reserved_paths_are_not_groups():
+    """t.me service paths that look like usernames are rejected"""
+    for raw in ['t.me/joinchat', 't.me/share', 't.me/Addstickers', 'https://t.me/proxy', 't.me/login']:
+        link = parse_link(raw)
+        assert link.kind == 'invalid', raw
+        assert link.error == 'not a group link', raw
+        assert not link.ok
+
+
+def test_rejects():
+    """Folders, phone numbers, other hosts and malformed usernames are refused with a reason"""
+    assert parse_link('t.me/addlist/abcdef').kind == 'folder'
+    assert not parse_link('t.me/addlist/abcdef').ok
+    assert parse_link('t.me/+123456789').error == 'phone number links are not groups'
+    assert parse_link('').error == 'empty'
+    assert parse_link('   ').error == 'empty'
+    assert parse_link('t.me/' + 'a' * 300).error == 'too long'
+    for raw in ['https://example.com/group', 't.me/abc', 't.me/1group', '@abc', 't.me/my-group', 'mygroup']:
+        link = parse_link(raw)
+        assert link.kind == 'invalid', raw
+        assert link.error == 'not a Telegram group link', raw
+        assert link.canonical is None
+
+
+def main():
+    """Run all tests"""
+    tests = [test_public_link_variants, test_invite_link_variants, test_reserved_paths_are_not_groups, test_rejects]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ PASS: {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"✗ FAIL: {test.__doc__}: {e!r}")
+    return failed == 0
+
+
+if __name__ == '__main__':
+    success = main()
+    raise SystemExit(0 if success else 1)
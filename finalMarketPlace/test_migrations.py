@@ -0,0 +1,177 @@
+"""
+Upgrade test for the schema migrations
+Builds a v0 database the way the original init_database did (before any
+migration existed), migrates it to SCHEMA_VERSION and checks the result:
+
+    python test_migrations.py    (or: python -m pytest test_migrations.py)
+"""
+import os
+import sqlite3
+import tempfile
+
+from migrations import migrate, get_schema_version, SCHEMA_VERSION
+
+# Original tables, without the columns later versions of init_database added
+V0_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        telegram_username TEXT,
+        usdt_wallet TEXT,
+        balance REAL DEFAULT 0,
+        created_ts INTEGER NOT NULL,
+        is_admin INTEGER DEFAULT 0
+    );
+    CREATE TABLE campaigns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        price_usd REAL NOT NULL,
+        target_count INTEGER NOT NULL,
+        sold_count INTEGER DEFAULT 0,
+        created_ts INTEGER NOT NULL
+    );
+    CREATE TABLE system_settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE listings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        campaign_id INTEGER NOT NULL,
+        group_link TEXT NOT NULL,
+        seller_tg TEXT,
+        seller_usdt TEXT,
+        price_usd REAL NOT NULL,
+        status TEXT NOT NULL,
+        check_reason TEXT,
+        check_log TEXT,
+        checked_by_session INTEGER,
+        receiver_session INTEGER,
+        created_ts INTEGER NOT NULL,
+        transferred_ts INTEGER
+    );
+    CREATE TABLE withdrawals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        seller_usdt TEXT NOT NULL,
+        amount_usdt REAL NOT NULL,
+        status TEXT DEFAULT 'pending',
+        txid TEXT,
+        created_ts INTEGER NOT NULL,
+        paid_ts INTEGER
+    );
+    CREATE TABLE admin_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_text TEXT NOT NULL,
+        username TEXT NOT NULL,
+        session_type TEXT DEFAULT 'checker',
+        status TEXT NOT NULL,
+        groups_received INTEGER DEFAULT 0,
+        last_used_ts INTEGER
+    );
+    INSERT INTO users (username, password_hash, balance, created_ts) VALUES ('seller', 'x', 12.34, 0);
+    INSERT INTO users (username, password_hash, balance, created_ts) VALUES ('empty', 'x', 0, 0);
+    INSERT INTO campaigns (title, year, price_usd, target_count, created_ts) VALUES ('2016 groups', 2016, 5, 10, 0);
+    INSERT INTO listings (user_id, campaign_id, group_link, price_usd, status, created_ts)
+        VALUES (1, 1, 't.me/group', 5, 'sold', 1000);
+'''
+
+
+def _baseline_database() -> sqlite3.Connection:
+    path = os.path.join(tempfile.mkdtemp(prefix='test_migrations_'), 'v0.db')
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript(V0_SCHEMA)
+    return conn
+
+
+def _names(conn, kind: str) -> set:
+    return {row[0] for row in conn.execute('SELECT name FROM sqlite_master WHERE type = ?', (kind,))}
+
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def test_upgrade_from_v0():
+    """A v0 database reaches SCHEMA_VERSION with every table, column and index"""
+    conn = _baseline_database()
+    assert get_schema_version(conn) == 0
+
+    assert migrate(conn) == SCHEMA_VERSION
+    assert get_schema_version(conn) == SCHEMA_VERSION
+
+    assert {'revoked_sessions', 'outbox', 'withdrawal_messages', 'balance_ledger',
+            'ledger_checkpoints'} <= _names(conn, 'table')
+    assert {'idx_listings_queue', 'idx_listings_pending_user', 'idx_listings_campaign_status',
+            'idx_listings_user_version', 'idx_outbox_due', 'idx_ledger_user', 'idx_ledger_ref'} <= _names(conn, 'index')
+    assert {'trg_listings_touch_insert', 'trg_listings_touch_update'} <= _names(conn, 'trigger')
+
+    assert {'included_in_withdrawal', 'vtime', 'expedite', 'updated_ts', 'version', 'claimed_by', 'claimed_ts'} <= _columns(conn, 'listings')
+    assert {'month', 'priority', 'expedite'} <= _columns(conn, 'campaigns')
+    assert 'balance_cents' in _columns(conn, 'users')
+
+
+def test_upgrade_keeps_data():
+    """Existing rows survive and are backfilled (cents balance, opening ledger entry, updated_ts)"""
+    conn = _baseline_database()
+    migrate(conn)
+
+    assert conn.execute("SELECT balance_cents FROM users WHERE username = 'seller'").fetchone() == (1234,)
+    assert conn.execute('SELECT user_id, amount_cents, kind FROM balance_ledger').fetchall() == [(1, 1234, 'opening')]
+    assert conn.execute('SELECT status, updated_ts FROM listings').fetchall() == [('sold', 1000 * 1000)]
+
+
+def test_version_counts_every_change():
+    """Each listing change bumps its version, even several within one millisecond"""
+    conn = _baseline_database()
+    migrate(conn)
+    conn.execute(
+        '''INSERT INTO listings (user_id, campaign_id, group_link, price_usd, status, created_ts)
+           VALUES (1, 1, 't.me/other', 5, 'pending', 2000)'''
+    )
+    probe = 'SELECT SUM(version), COUNT(*) FROM listings WHERE user_id = 1 AND id IN (1, 2)'
+    seen = [conn.execute(probe).fetchone()]
+
+    for listing_id, status in [(1, 'checking'), (2, 'checking'), (1, 'sold'), (2, 'failed')]:
+        conn.execute('UPDATE listings SET status = ? WHERE id = ?', (status, listing_id))
+        seen.append(conn.execute(probe).fetchone())
+
+    assert len(set(seen)) == len(seen)
+    assert conn.execute('SELECT version FROM listings ORDER BY id').fetchall() == [(2,), (2,)]
+
+    # Columns the trigger does not watch leave the version alone
+    conn.execute("UPDATE listings SET claimed_by = 'w' WHERE id = 1")
+    assert conn.execute('SELECT version FROM listings WHERE id = 1').fetchone() == (2,)
+
+
+def test_second_migrate_is_noop():
+    """Migrating a current database changes nothing"""
+    conn = _baseline_database()
+    migrate(conn)
+    schema = conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall()
+    changes = conn.total_changes
+
+    assert migrate(conn) == SCHEMA_VERSION
+    assert conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall() == schema
+    assert conn.total_changes == changes
+
+
+def main():
+    """Run all tests"""
+    tests = [test_upgrade_from_v0, test_upgrade_keeps_data, test_version_counts_every_change, test_second_migrate_is_noop]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ PASS: {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"✗ FAIL: {test.__doc__}: {e!r}")
+    return failed == 0
+
+
+if __name__ == '__main__':
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,117 @@
+"""
+Checks for the seller-fair check queue: interleaving of sellers with unequal
+queue depth, late arrivals, campaign priority and expedite
+
+    python test_scheduler.py    (or: python -m pytest test_scheduler.py)
+"""
+import os
+import sqlite3
+import tempfile
+
+from config import WORKER_ID
+from migrations import migrate
+from scheduler import claim_next, set_campaign_priority
+from routes.listing_routes import _insert_listings
+
+
+def _database() -> sqlite3.Connection:
+    """Migrated scratch database with three sellers and two campaigns"""
+    path = os.path.join(tempfile.mkdtemp(prefix='test_scheduler_'), 'queue.db')
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    for name in ('bulk', 'small', 'late'):
+        conn.execute("INSERT INTO users (username, password_hash, created_ts) VALUES (?, 'x', 0)", (name,))
+    conn.execute("INSERT INTO campaigns (title, year, price_usd, target_count, created_ts) VALUES ('2016', 2016, 5, 100, 0)")
+    conn.execute("INSERT INTO campaigns (title, year, price_usd, target_count, created_ts) VALUES ('2017', 2017, 5, 100, 0)")
+    return conn
+
+
+def _campaign(conn, campaign_id: int) -> dict:
+    price, priority, expedite = conn.execute(
+        'SELECT price_usd, priority, expedite FROM campaigns WHERE id = ?', (campaign_id,)
+    ).fetchone()
+    return {'id': campaign_id, 'price_usd': price, 'priority': priority, 'expedite': expedite}
+
+
+def _queue(conn, user_id: int, campaign_id: int, count: int):
+    """Queue count listings for one seller the way /sell does"""
+    user = {'id': user_id, 'telegram_username': None, 'usdt_wallet': None}
+    campaign = _campaign(conn, campaign_id)
+    rows = [
+        (user['id'], campaign_id, f't.me/u{user_id}c{campaign_id}g{i}', None, None, campaign['price_usd'], 'pending', 0)
+        for i in range(count)
+    ]
+    _insert_listings(conn.cursor(), campaign, rows)
+
+
+def _claim_sellers(conn, count: int) -> list:
+    """User ids of the next count claimed listings"""
+    return [claim_next(conn.cursor())[3] for _ in range(count)]
+
+
+def test_unequal_sellers_interleave():
+    """A seller with 2 queued listings is not stuck behind another seller's 6"""
+    conn = _database()
+    _queue(conn, 1, 1, 6)
+    _queue(conn, 2, 1, 2)
+
+    assert _claim_sellers(conn, 4) == [1, 2, 1, 2]
+    assert _claim_sellers(conn, 4) == [1, 1, 1, 1]
+    assert claim_next(conn.cursor()) is None
+
+
+def test_late_seller_starts_at_the_clock():
+    """A seller arriving mid-backlog is served next to the backlog, not after it"""
+    conn = _database()
+    _queue(conn, 1, 1, 6)
+    assert _claim_sellers(conn, 2) == [1, 1]
+
+    _queue(conn, 3, 1, 2)
+    assert _claim_sellers(conn, 6) == [1, 3, 1, 3, 1, 1]
+
+
+def test_claim_marks_listing():
+    """claim_next moves the listing to checking and records the claiming worker"""
+    conn = _database()
+    _queue(conn, 1, 1, 1)
+
+    listing_id, campaign_id, group_link, user_id = claim_next(conn.cursor())
+    assert (campaign_id, group_link, user_id) == (1, 't.me/u1c1g0', 1)
+    status, claimed_by, claimed_ts = conn.execute(
+        'SELECT status, claimed_by, claimed_ts FROM listings WHERE id = ?', (listing_id,)
+    ).fetchone()
+    assert status == 'checking'
+    assert claimed_by == WORKER_ID
+    assert claimed_ts is not None
+
+
+def test_priority_and_expedite():
+    """A priority-2 campaign gets two turns per turn of a priority-1 one; expedite jumps the queue"""
+    conn = _database()
+    set_campaign_priority(conn.cursor(), 2, 2, False)
+    _queue(conn, 1, 1, 4)
+    _queue(conn, 2, 2, 8)
+    assert _claim_sellers(conn, 6) == [2, 1, 2, 2, 1, 2]
+
+    set_campaign_priority(conn.cursor(), 1, 1, True)
+    assert _claim_sellers(conn, 2) == [1, 1]
+    assert _claim_sellers(conn, 4) == [2, 2, 2, 2]
+
+
+def main():
+    """Run all tests"""
+    tests = [test_unequal_sellers_interleave, test_late_seller_starts_at_the_clock, test_claim_marks_listing, test_priority_and_expedite]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ PASS: {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"✗ FAIL: {test.__doc__}: {e!r}")
+    return failed == 0
+
+
+if __name__ == '__main__':
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,28 @@
+"""
+In-memory checker throughput estimator (rolling window of completed checks)
+"""
+import time
+from collections import deque
+from config import THROUGHPUT_WINDOW, THROUGHPUT_SAMPLES, DEFAULT_CHECK_SECONDS
+
+# (finished_at, seconds) for recent completed checks, oldest first
+_samples = deque(maxlen=THROUGHPUT_SAMPLES)
+
+
+def record_check(seconds: float):
+    """Record one completed check (full worker cycle, sleeps included)"""
+    _samples.append((time.time(), seconds))
+
+
+def seconds_per_check() -> float:
+    """Mean cycle time over the window, or the default before any data"""
+    cutoff = time.time() - THROUGHPUT_WINDOW
+    recent = [seconds for finished_at, seconds in _samples if finished_at >= cutoff]
+    if not recent:
+        return DEFAULT_CHECK_SECONDS
+    return sum(recent) / len(recent)
+
+
+def estimate_wait(jobs_ahead: int) -> float:
+    """Seconds until jobs_ahead more checks have completed"""
+    return max(0, jobs_ahead) * seconds_per_check()